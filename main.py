@@ -1,14 +1,26 @@
 # -*- coding: utf-8 -*-
 
+from resources.lib import startup
+startup.begin()
+
 from resources.lib import kodilogging
 from resources.lib import script
 
 import logging
+import sys
 import xbmcaddon
 
 # Keep this file to a minimum, as Kodi
 # doesn't keep a compiled copy of this
 ADDON = xbmcaddon.Addon()
 kodilogging.config()
+startup.mark('modules imported')
 
-script.show_ui()
+try:
+    if sys.argv[1:] == ['import']:
+        script.import_deck()
+    else:
+        script.show_ui()
+finally:
+    # Kodi does not run the atexit handlers, the queued records would be lost
+    logging.shutdown()
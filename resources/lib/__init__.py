@@ -3,7 +3,14 @@ import xbmc
 
 DATA_DIR = xbmc.translatePath('special://profile/addon_data/script.remember.everything')
 IMG_DIR = os.path.join(DATA_DIR, 'img')
-if not os.path.exists(DATA_DIR):
-    os.mkdir(DATA_DIR)
-if not os.path.exists(IMG_DIR):
-    os.mkdir(IMG_DIR)
+
+# Home window property set while the script runs, the sync service keeps
+# away then
+RUNNING_PROPERTY = 'script.remember.everything.running'
+
+
+def make_dirs():
+    """Creates the profile directories of the addon, if they are missing."""
+    for dir_ in (DATA_DIR, IMG_DIR):
+        if not os.path.exists(dir_):
+            os.mkdir(dir_)
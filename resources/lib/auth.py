@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from . import files
+
+logger = logging.getLogger(__name__)
+
+
+class AuthError(Exception):
+    pass
+
+
+class TokenManager(object):
+    """Keeps the OAuth access token of the device fresh.
+
+    The token is refreshed in the background ``refresh_margin`` seconds
+    before it expires. If a caller still finds it expired, only one refresh
+    runs at a time and the other callers wait for its result. The
+    credentials file is replaced atomically.
+
+    Without credentials the device has to log in first: ``login(tokens)``
+    is called, it should run ``tokens.login`` with a way to show the code
+    to the user.
+    """
+
+    _TOKEN_URL = 'https://oauth2.googleapis.com/token'
+    _DEVICE_CODE_URL = 'https://oauth2.googleapis.com/device/code'
+
+    def __init__(self, client_id, client_secret, cred_path, transport,
+                 refresh_margin=300, login=None):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._cred_path = cred_path
+        self._transport = transport
+        self._refresh_margin = refresh_margin
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._error = None
+        self._timer = None
+        self._closed = False
+        self._refresh_token = None
+        self._load_tokens(login)
+        self._schedule_refresh()
+
+    @property
+    def token(self):
+        with self._cond:
+            if self._access_token_expires_at > time.time():
+                return self._access_token
+            if self._refreshing:
+                while self._refreshing:
+                    self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+                return self._access_token
+            self._refreshing = True
+        self._refresh()
+        return self._access_token
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+
+    def _schedule_refresh(self):
+        with self._cond:
+            if self._closed:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = max(0, self._access_token_expires_at -
+                        self._refresh_margin - time.time())
+            self._timer = threading.Timer(delay, self._refresh_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _refresh_in_background(self):
+        with self._cond:
+            if self._refreshing or self._closed:
+                return
+            self._refreshing = True
+        try:
+            self._refresh()
+        except Exception as e:  # pylint:disable=broad-except
+            # The timer thread has nobody to report to
+            logger.warning('Could not refresh the access token: %s', e)
+
+    def _refresh(self):
+        # The caller has set _refreshing, the request runs outside the lock.
+        # Whatever happens, the waiting callers are woken with the result.
+        error = None
+        try:
+            content = self._request_token({
+                'refresh_token': self._refresh_token,
+                'grant_type': 'refresh_token'
+            })
+        except Exception as e:  # pylint:disable=broad-except
+            error = e
+        with self._cond:
+            try:
+                if error is None:
+                    self._set_tokens(content)
+            except Exception as e:  # pylint:disable=broad-except
+                error = e
+            finally:
+                self._refreshing = False
+                self._error = error
+                self._cond.notify_all()
+        if error is not None:
+            raise error
+        self._schedule_refresh()
+
+    def _request_token(self, data):
+        data = dict(data, client_id=self._client_id,
+                    client_secret=self._client_secret)
+        resp = self._transport.post(self._TOKEN_URL, data=data, headers={
+            'Content-Type': 'application/x-www-form-urlencoded'
+        })
+        self._check_resp(resp)
+        return resp.json()
+
+    def _set_tokens(self, content):
+        self._access_token = content['access_token']
+        self._access_token_expires_at = int(
+            time.time()) + content['expires_in']
+        if 'refresh_token' in content:
+            self._refresh_token = content['refresh_token']
+        files.write_json(self._cred_path, {
+            'access_token': self._access_token,
+            'expires_at': self._access_token_expires_at,
+            'refresh_token': self._refresh_token
+        })
+
+    def _load_tokens(self, login):
+        if not os.path.exists(self._cred_path):
+            if login is None:
+                raise AuthError('The device is not logged in')
+            login(self)
+            return
+        with open(self._cred_path) as cred_file:
+            content = json.load(cred_file)
+        self._access_token = content['access_token']
+        self._access_token_expires_at = content['expires_at']
+        self._refresh_token = content['refresh_token']
+
+    def login(self, show_code, wait):
+        """Logs the device in with the OAuth device flow.
+
+        show_code(verification_url, user_code, expires_in) shows what the
+        user has to type where, then the token endpoint is polled at the
+        interval the server asks for. wait(seconds) waits between the polls
+        and returns False if the user cancelled the login.
+        """
+        resp = self._transport.post(self._DEVICE_CODE_URL, data={
+            'client_id': self._client_id,
+            'scope': 'https://www.googleapis.com/auth/spreadsheets'
+        })
+        self._check_resp(resp)
+        content = resp.json()
+        expires_in = content.get('expires_in', 1800)
+        interval = content.get('interval', 5)
+        deadline = time.time() + expires_in
+        show_code(content['verification_url'], content['user_code'],
+                  expires_in)
+
+        while time.time() < deadline:
+            if not wait(interval):
+                raise AuthError('The login was cancelled')
+            resp = self._transport.post(self._TOKEN_URL, data={
+                'client_id': self._client_id,
+                'client_secret': self._client_secret,
+                'device_code': content['device_code'],
+                'grant_type': 'urn:ietf:params:oauth:grant-type:device_code'
+            }, headers={
+                'Content-Type': 'application/x-www-form-urlencoded'
+            })
+            if resp.ok:
+                self._set_tokens(resp.json())
+                return
+            error = _error_code(resp)
+            if error == 'slow_down':
+                interval += 5
+            elif error != 'authorization_pending':
+                raise AuthError(resp.text)
+        raise AuthError('The login code expired')
+
+    @staticmethod
+    def _check_resp(resp):
+        if not resp.ok:
+            raise AuthError(resp.text)
+
+
+def _error_code(resp):
+    try:
+        return resp.json().get('error')
+    except ValueError:
+        return None
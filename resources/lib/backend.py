@@ -0,0 +1,65 @@
+"""Where the decks live.
+
+A backend keeps worksheets of cards, every card is a row, numbered from 2
+like in a spreadsheet. GoogleSheets keeps them in a Google spreadsheet,
+LocalDecks in a file on the device.
+"""
+GOOGLE = 0
+LOCAL = 1
+
+
+class DeckError(Exception):
+    """permanent tells that sending the same request again will not help,
+    like a write to a worksheet that was renamed."""
+
+    def __init__(self, message='', permanent=False):
+        Exception.__init__(self, message)
+        self.permanent = permanent
+
+
+def data_prefix(deck_backend):
+    """Prefix of the backend's files in the profile, so the stores of the
+    backends do not mix."""
+    return 'local-' if deck_backend == LOCAL else ''
+
+
+class DeckBackend(object):
+    """What the addon needs from a backend."""
+
+    def get_sheet_names(self):
+        # type: () -> list
+        raise NotImplementedError
+
+    def get_cards(self, sheet_name):
+        for _, _, cards in self.get_card_pages(sheet_name):
+            for card in cards:
+                yield card
+
+    def get_card_pages(self, sheet_name):
+        """Yields the cards of the worksheet in (first row, last row, cards)
+        blocks."""
+        raise NotImplementedError
+
+    def get_scheduled_cards(self, sheet_names, needs_content):
+        """Returns the cards of the worksheets in a dict by worksheet name.
+
+        needs_content(sheet_name, idx, schedule_row) tells which rows need
+        their content, the others may come with their question set to None.
+        """
+        raise NotImplementedError
+
+    def update_card(self, sheet_name, card):
+        self.update_cards([(sheet_name, card)])
+
+    def update_cards(self, updates):
+        # type: (list) -> None
+        """Writes the review state of (sheet_name, card) pairs."""
+        raise NotImplementedError
+
+    @property
+    def request_stats(self):
+        # type: () -> dict
+        return {}
+
+    def close(self):
+        pass
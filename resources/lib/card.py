@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import time
 
 scores = [
     'complete blackout',
@@ -10,16 +11,77 @@ scores = [
 ]
 
 
+_days = {}
+
+
+def _day_epoch(day):
+    # mktime is slow, the start of each day is looked up once. Days with a
+    # DST change are not cached, they go through mktime for every value.
+    epoch = _days.get(day)
+    if epoch is None:
+        if len(_days) > 10000:
+            _days.clear()
+        year, month, day_ = int(day[0:4]), int(day[5:7]), int(day[8:10])
+        epoch = time.mktime(datetime(year, month, day_).timetuple())
+        next_day = datetime(year, month, day_) + timedelta(days=1)
+        if time.mktime(next_day.timetuple()) - epoch != 86400:
+            epoch = False
+        _days[day] = epoch
+    return epoch
+
+
+def parse_time(value):
+    """Returns the epoch seconds of an isoformat() local time, None if empty.
+
+    Numbers are taken as epoch seconds already.
+    """
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        epoch = _day_epoch(value[0:10])
+        if epoch is False:
+            moment = datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13] or 0), int(value[14:16] or 0))
+            return time.mktime(moment.timetuple()) + float(value[17:] or 0)
+        return epoch + int(value[11:13] or 0) * 3600 + \
+            int(value[14:16] or 0) * 60 + float(value[17:] or 0)
+    except ValueError:
+        return None
+
+
+def format_time(epoch):
+    """Formats epoch seconds back to the isoformat() used in the sheet."""
+    if not epoch:
+        return ''
+    return datetime.fromtimestamp(epoch).isoformat()
+
+
 class Card(object):
+    """A flash card with its SM-2 state.
+
+    first_practice and next_practice are epoch seconds, first_practice is
+    None and next_practice 0 for a card that was never practised. sheet is
+    the worksheet the card comes from, idx its row there.
+    """
+
+    __slots__ = (
+        'sheet', 'idx', 'question', 'answer', 'first_practice',
+        'next_practice', 'streak', 'interval', 'easiness',
+        'question_picture', 'answer_picture')
+
     def __init__(self, idx, question, answer, first_practice, next_practice,
                  streak, interval, easiness):
+        self.sheet = None
         self.idx = idx
         self.question = question
         self.answer = answer
-        self.first_practice = first_practice
-        self.next_practice = next_practice
+        self.first_practice = parse_time(first_practice)
+        self.next_practice = parse_time(next_practice) or 0.0
         self.streak = int(streak) if streak else 0
-        self.interval = float(interval) if interval else 1
+        self.interval = float(interval) if interval not in (None, '') else 1
         self.easiness = float(easiness) if easiness else 2.5
         self.question_picture = None
         self.answer_picture = None
@@ -42,8 +104,17 @@ class Card(object):
         else:
             self.interval = self.interval * self.easiness
 
+        now = time.time()
         if not self.first_practice:
-            self.first_practice = datetime.now().isoformat()
+            self.first_practice = now
+
+        self.next_practice = now + self.interval * 86400
+
+    def relearned(self):
+        """Ends the relearning of a lapsed card, it is due again in a day.
 
-        self.next_practice = (
-            datetime.now() + timedelta(days=self.interval)).isoformat()
+        The reviews of the relearning steps do not change the easiness.
+        """
+        self.streak = 1
+        self.interval = 1
+        self.next_practice = time.time() + self.interval * 86400
@@ -0,0 +1,25 @@
+import json
+import os
+
+
+def write_json(path, content):
+    """Writes the JSON file atomically: readers see the old or the new one."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as tmp_file:
+        json.dump(content, tmp_file)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Windows does not replace an existing file
+        os.remove(path)
+        os.rename(tmp_path, path)
+
+
+def read_json(path):
+    """Returns the content of the JSON file, None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as json_file:
+        return json.load(json_file)
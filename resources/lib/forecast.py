@@ -0,0 +1,90 @@
+"""Array form of the deck's SM-2 state and a review workload forecast.
+
+Needs NumPy, ``available`` tells whether it could be imported.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+available = np is not None
+
+_DAY = 86400.0
+
+
+class DeckArrays(object):
+    """Scheduling state of many cards, one array per Card field.
+
+    ``due`` is in days relative to the time the arrays were made, cards that
+    were never practised are due at 0. The arrays can have any shape, the
+    forecast uses one row per simulation run.
+    """
+
+    def __init__(self, streak, interval, easiness, due):
+        self.streak = streak
+        self.interval = interval
+        self.easiness = easiness
+        self.due = due
+
+    @classmethod
+    def from_states(cls, states, now):
+        # type: (list, float) -> DeckArrays
+        """states are (next_practice, streak, interval, easiness) tuples,
+        next_practice and now in epoch seconds."""
+        next_practice = np.array(
+            [state[0] for state in states], dtype=np.float64)
+        return cls(
+            streak=np.array([state[1] or 0 for state in states], dtype=np.int32),
+            interval=np.array(
+                [state[2] if state[2] is not None else 1 for state in states],
+                dtype=np.float64),
+            easiness=np.array(
+                [state[3] or 2.5 for state in states], dtype=np.float64),
+            due=np.maximum(next_practice - now, 0.0) / _DAY
+        )
+
+    def copy(self, runs=None):
+        arrays = [self.streak, self.interval, self.easiness, self.due]
+        if runs is not None:
+            arrays = [np.tile(array, (runs, 1)) for array in arrays]
+        return DeckArrays(*[array.copy() for array in arrays])
+
+    def update(self, mask, scores, now):
+        """Applies Card.update to the cards in mask, reviewed at day now."""
+        index = np.nonzero(mask)
+        self.review(index, np.broadcast_to(scores, mask.shape)[index], now)
+
+    def review(self, index, scores, now):
+        """Same as update, for the cards at index with one score each."""
+        streak = np.where(scores < 3, 0, self.streak[index] + 1)
+        lapse = 5.0 - scores
+        easiness = np.maximum(
+            1.3, self.easiness[index] + 0.1 - lapse * (0.08 + lapse * 0.02))
+        interval = np.where(
+            streak == 0, 0.0, np.where(
+                streak == 1, 1.0, np.where(
+                    streak == 2, 4.0, self.interval[index] * easiness)))
+        self.streak[index] = streak
+        self.easiness[index] = easiness
+        self.interval[index] = interval
+        self.due[index] = now + interval
+
+
+def forecast(deck, days=30, runs=10, recall=0.9, seed=None):
+    # type: (DeckArrays, int, int, float, int) -> list
+    """Simulates the reviews of the next days and returns the due count of
+    each day, averaged over the runs.
+
+    Every due card is reviewed on its day, remembered with probability recall
+    (score 4) or forgotten (score 2). Forgotten cards come back the next day.
+    """
+    rng = np.random.RandomState(seed)
+    state = deck.copy(runs)
+    counts = np.zeros(days)
+    for day in range(days):
+        index = np.nonzero(state.due < day + 1)
+        reviewed = len(index[0])
+        counts[day] = reviewed / float(runs)
+        scores = np.where(rng.random_sample(reviewed) < recall, 4, 2)
+        state.review(index, scores, day)
+    return counts.tolist()
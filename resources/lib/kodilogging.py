@@ -4,38 +4,88 @@ from __future__ import unicode_literals
 from resources.lib.kodiutils import get_setting_as_bool
 
 import logging
+import threading
 import xbmc
 import xbmcaddon
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 
 class KodiLogHandler(logging.StreamHandler):
+    """Writes the log records to the Kodi log from a background thread.
+
+    The debug setting is read once and again when the settings change, so
+    a record that is not logged costs next to nothing on the calling thread.
+    """
+
+    LEVELS = {
+        logging.CRITICAL: xbmc.LOGFATAL,
+        logging.ERROR: xbmc.LOGERROR,
+        logging.WARNING: xbmc.LOGWARNING,
+        logging.INFO: xbmc.LOGINFO,
+        logging.DEBUG: xbmc.LOGDEBUG,
+        logging.NOTSET: xbmc.LOGNONE,
+    }
 
     def __init__(self):
         logging.StreamHandler.__init__(self)
         addon_id = xbmcaddon.Addon().getAddonInfo('id')
-        prefix = b"[%s] " % addon_id
-        formatter = logging.Formatter(prefix + b'%(name)s: %(message)s')
-        self.setFormatter(formatter)
+        fmt = '[{}] %(name)s: %(message)s'.format(addon_id.decode('utf-8'))
+        # Byte strings on Python 2 like the messages, text on Python 3
+        if bytes is str:
+            fmt = fmt.encode('utf-8')
+        self.setFormatter(logging.Formatter(fmt))
+        self.debug = get_setting_as_bool('debug')
+        self._monitor = SettingsMonitor(self)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def refresh(self):
+        self.debug = get_setting_as_bool('debug')
 
     def emit(self, record):
-        levels = {
-            logging.CRITICAL: xbmc.LOGFATAL,
-            logging.ERROR: xbmc.LOGERROR,
-            logging.WARNING: xbmc.LOGWARNING,
-            logging.INFO: xbmc.LOGINFO,
-            logging.DEBUG: xbmc.LOGDEBUG,
-            logging.NOTSET: xbmc.LOGNONE,
-        }
-        if get_setting_as_bool('debug'):
+        if self.debug:
+            try:
+                self._queue.put((self.format(record), self.LEVELS[record.levelno]))
+            except Exception:
+                self.handleError(record)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            message, level = item
             try:
-                xbmc.log(self.format(record), levels[record.levelno])
+                xbmc.log(message, level)
             except UnicodeEncodeError:
-                xbmc.log(self.format(record).encode(
-                    'utf-8', 'ignore'), levels[record.levelno])
+                xbmc.log(message.encode('utf-8', 'ignore'), level)
 
     def flush(self):
         pass
 
+    def close(self):
+        """Writes the queued records and stops the thread, called by
+        logging.shutdown."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(5)
+        logging.StreamHandler.close(self)
+
+
+class SettingsMonitor(xbmc.Monitor):
+    def __init__(self, handler):
+        xbmc.Monitor.__init__(self)
+        self._handler = handler
+
+    def onSettingsChanged(self):
+        self._handler.refresh()
+
 
 def config():
     logger = logging.getLogger()
@@ -0,0 +1,175 @@
+"""The sync service: brings the recently used decks and their pictures up to
+date while Kodi is idle, so the script finds everything local and current.
+"""
+import logging
+import os
+import time
+
+import xbmc
+import xbmcgui
+
+from . import backend
+from . import kodiutils
+from . import recent
+from . import scheduler
+from . import sheetlist
+from . import startup
+from . import store
+from . import sync
+from . import DATA_DIR
+from . import RUNNING_PROPERTY
+from . import make_dirs
+
+# Imported on first use, not while Kodi starts
+localdeck = startup.LazyModule('resources.lib.localdeck')
+pictures = startup.LazyModule('resources.lib.pictures')
+requests = startup.LazyModule('requests')
+sheet = startup.LazyModule('resources.lib.sheet')
+transport = startup.LazyModule('resources.lib.transport')
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the checks whether a sync should run
+_CHECK_INTERVAL = 60
+# Kodi counts as idle after this many seconds without input
+_IDLE_SECONDS = 300
+# Decks opened in this many days are kept up to date
+_RECENT_DAYS = 14
+# Longest a sync may run, in seconds
+_TIME_BUDGET = 120
+# Pictures of the cards due within this many seconds are downloaded
+_PICTURES_AHEAD = 86400
+
+
+class SyncService(xbmc.Monitor):
+    """Syncs every ``service_interval`` minutes, if Kodi has been idle for a
+    while, nothing plays and the script is not running.
+
+    A sync refreshes the worksheet list, the cards of the recently opened
+    decks and then the pictures of their next sessions, in session order.
+    It stops as soon as the user is back, after _TIME_BUDGET seconds, or
+    once ``service_picture_mb`` of pictures are downloaded. Picture work is
+    paced to take at most half of the time, to leave the CPU to Kodi.
+    """
+
+    def __init__(self):
+        xbmc.Monitor.__init__(self)
+        self._last_sync = 0
+
+    def run(self):
+        while not self.waitForAbort(_CHECK_INTERVAL):
+            if not kodiutils.get_setting_as_bool('service_sync'):
+                continue
+            interval = (kodiutils.get_setting_as_int('service_interval') or 60) * 60
+            if time.time() - self._last_sync < interval or not self.idle():
+                continue
+            self._last_sync = time.time()
+            try:
+                self.sync()
+            except (backend.DeckError, requests.RequestException) as e:
+                logger.warning('Background sync failed: %s', e)
+            except Exception:
+                # One failed sync must not end the service
+                logger.exception('Background sync failed')
+
+    def idle(self):
+        return xbmc.getGlobalIdleTime() >= _IDLE_SECONDS and \
+            not xbmc.Player().isPlaying() and \
+            not xbmcgui.Window(10000).getProperty(RUNNING_PROPERTY)
+
+    def sync(self):
+        deck_backend = kodiutils.get_setting_as_int('backend')
+        prefix = backend.data_prefix(deck_backend)
+        sheet_names = recent.RecentDecks(
+            os.path.join(DATA_DIR, prefix + 'recent_decks.json')).get(
+                time.time() - _RECENT_DAYS * 86400)
+        deadline = time.time() + _TIME_BUDGET
+        make_dirs()
+        # The script may have changed the picture cache since the last sync
+        pictures.reload_cache()
+        pool_size = kodiutils.get_setting_as_int('http_pool_size') or 4
+        http = transport.Transport(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            timeout=kodiutils.get_setting_as_int('http_timeout') or 30)
+        cards = store.CardStore(os.path.join(DATA_DIR, prefix + 'cards.db'))
+        decks = None
+        try:
+            if deck_backend == backend.LOCAL:
+                decks = localdeck.LocalDecks(os.path.join(DATA_DIR, 'decks.db'))
+            else:
+                decks = self._google_sheets(http)
+                if decks is None:
+                    return
+                sheetlist.SheetListCache(
+                    os.path.join(DATA_DIR, 'sheet_names.json'),
+                    kodiutils.get_setting('sheet_id')).put(
+                        decks.get_sheet_names())
+            # Checked inside the syncs too, so the store is left alone as
+            # soon as the user is back
+            def stop():
+                return not self._may_go_on(deadline)
+
+            for sheet_name in sheet_names:
+                if stop():
+                    return
+                if cards.has_sheet(sheet_name):
+                    sync.sync_sheets(decks, cards, [sheet_name], stop=stop)
+                else:
+                    sync.stream_sheets(
+                        decks, cards, [sheet_name], lambda _: None, stop=stop)
+            self._download_pictures(http, cards, sheet_names, deadline)
+        finally:
+            if decks is not None:
+                decks.close()
+            cards.close()
+            http.close()
+
+    def _google_sheets(self, http):
+        """Returns the sheet of the settings, None if the device has not
+        logged in yet: the service cannot ask the user."""
+        if not os.path.exists(os.path.join(DATA_DIR, 'creds.json')):
+            return None
+        client_id = kodiutils.get_setting('client_id')
+        client_secret = kodiutils.get_setting('client_secret')
+        sheet_id = kodiutils.get_setting('sheet_id')
+        if not (client_id and client_secret and sheet_id):
+            return None
+        return sheet.GoogleSheets(client_id, client_secret, sheet_id, http)
+
+    def _download_pictures(self, http, cards, sheet_names, deadline):
+        if not sheet_names:
+            return
+        now = time.time()
+        # The order the cards will come in the sessions
+        session = scheduler.ReviewScheduler(
+            cards.get_due_cards(sheet_names, now + _PICTURES_AHEAD), now,
+            max_reviews=kodiutils.get_setting_as_int('max_reviews'),
+            max_new=kodiutils.get_setting_as_int('max_new'),
+            reviews_per_new=kodiutils.get_setting_as_int('reviews_per_new') or 4)
+        byte_budget = (kodiutils.get_setting_as_int('service_picture_mb') or 50) \
+            * 1024 * 1024
+        max_bytes = (kodiutils.get_setting_as_int(
+            'picture_cache_mb') or 200) * 1024 * 1024
+        downloaded = 0
+        card = session.next(now)
+        while card is not None and downloaded < byte_budget:
+            for url in (card.question_picture, card.answer_picture):
+                if not url:
+                    continue
+                if not self._may_go_on(deadline):
+                    return
+                start = time.time()
+                try:
+                    downloaded += pictures.download_picture(http, url, max_bytes)
+                except (pictures.PictureError, requests.RequestException) as e:
+                    logger.debug('Could not download %s: %s', url, e)
+                # As long a pause as the work took
+                if self.waitForAbort(time.time() - start):
+                    return
+            card = session.next(now)
+        logger.debug('Background sync downloaded %d bytes of pictures',
+                     downloaded)
+
+    def _may_go_on(self, deadline):
+        return time.time() < deadline and not self.abortRequested() and \
+            self.idle()
@@ -0,0 +1,254 @@
+import csv
+import io
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+
+try:
+    from HTMLParser import HTMLParser
+    _unescape = HTMLParser().unescape
+except ImportError:
+    from html import unescape as _unescape
+
+if bytes is str:
+    # The csv module of Python 2 reads bytes, the cells are decoded
+    def _open_csv(path):
+        return open(path, 'rb')
+else:
+    def _open_csv(path):
+        return io.open(path, encoding='utf-8', newline='')
+
+from .backend import DeckBackend, DeckError
+from .card import Card
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS decks (
+    sheet TEXT PRIMARY KEY,
+    imported_at REAL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    sheet TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    question_picture TEXT,
+    answer_picture TEXT,
+    first_practice REAL,
+    next_practice REAL NOT NULL DEFAULT 0,
+    streak INTEGER,
+    interval REAL,
+    easiness REAL,
+    PRIMARY KEY (sheet, idx)
+);
+'''
+
+_COLUMNS = (
+    'idx, question, answer, question_picture, answer_picture, '
+    'first_practice, next_practice, streak, interval, easiness')
+
+# Rows read from SQLite or inserted into it at a time
+_BLOCK_ROWS = 5000
+
+
+class LocalDecks(DeckBackend):
+    """Decks kept in a SQLite file on the device, no network needed.
+
+    Worksheets are read with one query each and review state is written in
+    one transaction per batch. Decks get here with ``import_deck``.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def get_sheet_names(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT sheet FROM decks ORDER BY sheet').fetchall()
+        return [row[0] for row in rows]
+
+    def get_card_pages(self, sheet_name):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT {} FROM rows WHERE sheet = ? ORDER BY idx'.format(
+                    _COLUMNS), (sheet_name,)).fetchall()
+        for i in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[i:i + _BLOCK_ROWS]
+            yield block[0][0], block[-1][0], [
+                self._to_card(sheet_name, row) for row in block]
+
+    def get_scheduled_cards(self, sheet_names, needs_content):
+        # The content is local, it is always there
+        return dict(
+            (sheet_name, list(self.get_cards(sheet_name)))
+            for sheet_name in sheet_names)
+
+    def update_cards(self, updates):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE rows SET first_practice = ?, next_practice = ?, '
+                'streak = ?, interval = ?, easiness = ? '
+                'WHERE sheet = ? AND idx = ?',
+                [
+                    (card.first_practice, card.next_practice, card.streak,
+                     card.interval, card.easiness, sheet_name, card.idx)
+                    for sheet_name, card in updates
+                ])
+
+    def import_deck(self, sheet_name, rows, on_progress=None):
+        # type: (str, list, callable) -> int
+        """Replaces the worksheet with rows of (question, answer,
+        question_picture, answer_picture).
+
+        Rows whose question was already in the worksheet keep their review
+        state. on_progress(done, total) is called after every block of
+        rows. Returns the number of cards imported.
+        """
+        with self._lock, self._conn:
+            states = dict(
+                (row[0], row[1:])
+                for row in self._conn.execute(
+                    'SELECT question, first_practice, next_practice, streak, '
+                    'interval, easiness FROM rows WHERE sheet = ?',
+                    (sheet_name,)))
+            self._conn.execute('DELETE FROM rows WHERE sheet = ?', (sheet_name,))
+            for i in range(0, len(rows), _BLOCK_ROWS):
+                self._conn.executemany(
+                    'INSERT INTO rows (sheet, {}) VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(_COLUMNS),
+                    [
+                        (sheet_name, 2 + i + j, question, answer,
+                         question_picture, answer_picture) + tuple(
+                            states.get(question, (None, 0, None, None, None)))
+                        for j, (question, answer, question_picture,
+                                answer_picture) in enumerate(
+                                    rows[i:i + _BLOCK_ROWS])
+                    ])
+                if on_progress is not None:
+                    on_progress(min(i + _BLOCK_ROWS, len(rows)), len(rows))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO decks (sheet, imported_at) '
+                'VALUES (?, ?)', (sheet_name, time.time()))
+        return len(rows)
+
+    def remove_deck(self, sheet_name):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM rows WHERE sheet = ?', (sheet_name,))
+            self._conn.execute('DELETE FROM decks WHERE sheet = ?', (sheet_name,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_card(sheet_name, row):
+        card = Card(*row[0:3] + row[5:10])
+        card.sheet = sheet_name
+        card.question_picture, card.answer_picture = row[3:5]
+        return card
+
+
+def read_deck(path):
+    # type: (str) -> list
+    """Reads the cards of an Anki package (.apkg) or a CSV file."""
+    if path.lower().endswith('.apkg'):
+        return read_apkg(path)
+    return read_csv(path)
+
+
+def read_csv(path):
+    # type: (str) -> list
+    """Reads rows of question, answer and optionally the question and the
+    answer picture URL, separated by commas, semicolons or tabs.
+
+    A first row starting with "question" is taken as a header.
+    """
+    with _open_csv(path) as csv_file:
+        rows = []
+        try:
+            sample = csv_file.read(64 * 1024)
+            csv_file.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            for row in csv.reader(csv_file, dialect):
+                row = [_decode(cell).strip() for cell in row]
+                if len(row) < 2 or not row[0].lstrip(u'\ufeff'):
+                    continue
+                row[0] = row[0].lstrip(u'\ufeff')
+                if not rows and row[0].lower() == u'question':
+                    continue
+                row += [u''] * (4 - len(row))
+                rows.append((row[0], row[1], row[2] or None, row[3] or None))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise DeckError('Cannot read the CSV file: {}'.format(e))
+    return rows
+
+
+def read_apkg(path):
+    # type: (str) -> list
+    """Reads the notes of an Anki package, the first field of a note is the
+    question, the second one the answer.
+
+    Formatting is dropped and the pictures of the package are not imported.
+    """
+    try:
+        package = zipfile.ZipFile(path)
+    except zipfile.BadZipfile as e:
+        raise DeckError('Not an Anki package: {}'.format(e))
+    names = package.namelist()
+    # Packages of new Anki versions have a compressed collection.anki21b
+    # and only a placeholder collection.anki2
+    collection = next((
+        name for name in ('collection.anki21', 'collection.anki2')
+        if name in names), None)
+    if collection is None or collection == 'collection.anki2' and \
+            'collection.anki21b' in names:
+        raise DeckError(
+            'Unsupported Anki package, export it with '
+            '"Support older Anki versions" checked')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        package.extract(collection, tmp_dir)
+        conn = sqlite3.connect(os.path.join(tmp_dir, collection))
+        try:
+            notes = conn.execute('SELECT flds FROM notes ORDER BY id').fetchall()
+        except sqlite3.DatabaseError as e:
+            raise DeckError('Cannot read the Anki package: {}'.format(e))
+        finally:
+            conn.close()
+    finally:
+        package.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    rows = []
+    for (fields,) in notes:
+        fields = fields.split(u'\x1f')
+        if len(fields) < 2:
+            continue
+        question, answer = _plain_text(fields[0]), _plain_text(fields[1])
+        if question:
+            rows.append((question, answer, None, None))
+    return rows
+
+
+_BREAK = re.compile(r'<br\s*/?>|</div>|</p>', re.IGNORECASE)
+_TAG = re.compile(r'<[^>]*>|\[sound:[^\]]*\]')
+
+
+def _plain_text(html):
+    text = _unescape(_TAG.sub(u'', _BREAK.sub(u'\n', html)))
+    return u'\n'.join(
+        line.strip() for line in text.splitlines() if line.strip())
+
+
+def _decode(cell):
+    if isinstance(cell, bytes):
+        return cell.decode('utf-8')
+    return cell
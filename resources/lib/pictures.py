@@ -1,12 +1,15 @@
 from collections import namedtuple
-import mimetypes
+import hashlib
 import os
 from PIL import Image
-import requests
 import shutil
-from time import sleep
+import tempfile
+import threading
+import time
 
 from . import IMG_DIR
+from . import files
+from . import timing
 
 
 SCREEN_WIDTH = 1920
@@ -32,33 +35,287 @@ class PictureError(Exception):
     pass
 
 
-def download_picture(url, name):
-    # type: (str, str) -> None
-    path = _get_picture_path(name)
-    if os.path.exists(path):
-        return
-    resp = requests.get(url, stream=True)
-    if not resp.ok:
-        raise PictureError(resp.text)
-    dir_ = os.path.dirname(path)
-    if not os.path.exists(dir_):
-        os.mkdir(dir_)
-    with open(path, 'wb') as out_file:
-        shutil.copyfileobj(resp.raw, out_file)
+class PictureCache(object):
+    """The prepared pictures on disk and their index.
 
+    Pictures are looked up by URL. An URL entry keeps the ETag and
+    Last-Modified of the response, so it can be revalidated with a
+    conditional GET, and points to a content entry: the display file, named
+    by the hash of the downloaded bytes, with its position on screen. URLs
+    with the same content share one display file.
 
-def _get_picture_path(name):
-    return os.path.join(IMG_DIR, name)
+    Beyond ``max_bytes`` of display files the least recently shown ones are
+    evicted.
+    """
 
+    _SAVE_INTERVAL = 60
 
-def get_picture(name):
-    # type: (str) -> Picture
-    path = _get_picture_path(name)
+    def __init__(self, dir_, max_bytes):
+        self._dir = dir_
+        self._path = os.path.join(dir_, 'cache.json')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._saved_at = 0
+        try:
+            content = files.read_json(self._path)
+        except ValueError:
+            content = None
+        if content is None:
+            self._remove_legacy()
+            content = {'urls': {}, 'contents': {}}
+        self._urls = content['urls']
+        self._contents = content['contents']
+        self._sweep()
+
+    def get(self, url):
+        # type: (str) -> Picture
+        """Returns the picture of the URL, None if it is not cached."""
+        with self._lock:
+            content = self._content(url)
+            if content is None:
+                return None
+            content['used_at'] = time.time()
+            if time.time() - self._saved_at > self._SAVE_INTERVAL:
+                self._save()
+        return Picture(content['path'], content['x'], content['y'],
+                       content['width'], content['height'])
+
+    def validators(self, url):
+        # type: (str) -> dict
+        """Returns the conditional request headers of a cached URL."""
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None or self._content(url) is None:
+                return {}
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def checked_at(self, url):
+        with self._lock:
+            if self._content(url) is None:
+                return None
+            return self._urls[url]['checked_at']
+
+    def touch(self, url):
+        """Records that the cached content of the URL is still current."""
+        with self._lock:
+            self._urls[url]['checked_at'] = time.time()
+            self._save()
+
+    def has_content(self, digest):
+        with self._lock:
+            return digest in self._contents
+
+    def put(self, url, digest, picture, etag=None, last_modified=None):
+        """Adds a downloaded URL. picture is the prepared display file under
+        a temporary name of its own, None if the content is already cached.
+
+        The display file gets its final name, from the digest, here under
+        the lock, so concurrent downloads of the same content cannot remove
+        each other's file.
+        """
+        with self._lock:
+            if picture is not None and digest in self._contents:
+                # Prepared by another download meanwhile
+                os.remove(picture.path)
+                picture = None
+            if picture is not None:
+                path = os.path.join(
+                    self._dir, digest + os.path.splitext(picture.path)[1])
+                try:
+                    os.rename(picture.path, path)
+                except OSError:
+                    # Windows does not replace an existing file
+                    os.remove(path)
+                    os.rename(picture.path, path)
+                picture.path = path
+                self._contents[digest] = {
+                    'path': picture.path,
+                    'x': picture.x,
+                    'y': picture.y,
+                    'width': picture.width,
+                    'height': picture.height,
+                    'size': os.path.getsize(picture.path),
+                    'used_at': time.time()
+                }
+            self._urls[url] = {
+                'content': digest,
+                'etag': etag,
+                'last_modified': last_modified,
+                'checked_at': time.time()
+            }
+            self._evict(keep=digest)
+            self._save()
+
+    def _content(self, url):
+        entry = self._urls.get(url)
+        if entry is None:
+            return None
+        content = self._contents.get(entry['content'])
+        if content is None or not os.path.exists(content['path']):
+            return None
+        return content
+
+    def _evict(self, keep):
+        total = sum(content['size'] for content in self._contents.values())
+        by_use = sorted(
+            self._contents.items(), key=lambda item: item[1]['used_at'])
+        for digest, content in by_use:
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= content['size']
+            del self._contents[digest]
+            try:
+                os.remove(content['path'])
+            except OSError:
+                pass
+        for url in [url for url, entry in self._urls.items()
+                    if entry['content'] not in self._contents]:
+            del self._urls[url]
+
+    def _save(self):
+        files.write_json(self._path, {
+            'urls': self._urls,
+            'contents': self._contents
+        })
+        self._saved_at = time.time()
+
+    def _sweep(self):
+        """Removes the files the index does not know: downloads that were
+        interrupted, and display files whose entry the other process
+        overwrote when it saved its index.
+
+        The script and the service share the directory, a recent file may
+        belong to a download of the other one that is not in the index yet.
+        """
+        known = set(
+            os.path.basename(content['path'])
+            for content in self._contents.values())
+        for name in os.listdir(self._dir):
+            path = os.path.join(self._dir, name)
+            if name in known or name.startswith('cache.json') or \
+                    not os.path.isfile(path):
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) > _STALE_FILE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_legacy(self):
+        # Pictures used to be stored per card, under {sheet}/{side}{row}
+        for name in os.listdir(self._dir):
+            path = os.path.join(self._dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name == 'index.json':
+                os.remove(path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+_DOWNLOAD_PREFIX = '.download-'
+# Seconds after which a file the index does not know counts as abandoned
+_STALE_FILE = 3600
+
+# Cached pictures are revalidated after a day
+REVALIDATE_AFTER = 86400
+DEFAULT_CACHE_BYTES = 200 * 1024 * 1024
+
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PictureCache(IMG_DIR, DEFAULT_CACHE_BYTES)
+    return _cache
+
+
+def reload_cache():
+    """Drops the loaded index, the next use reads it again from disk.
+
+    For the long-running service: the script changes the index meanwhile.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+@timing.timed('download_picture')
+def download_picture(transport, url, max_bytes=DEFAULT_CACHE_BYTES):
+    # type: (Transport, str, int) -> int
+    """Makes sure the picture of the URL is cached and current.
+
+    A picture checked within REVALIDATE_AFTER seconds is used as it is,
+    an older one is revalidated with a conditional GET. A new picture is
+    scaled down to fit the picture area and saved as JPEG, or PNG if it has
+    transparency, unless the same content is cached already. The cache is
+    then trimmed to max_bytes. Returns the number of bytes downloaded.
+    """
+    cache = _get_cache()
+    cache.max_bytes = max_bytes
+    checked_at = cache.checked_at(url)
+    if checked_at is not None and time.time() - checked_at < REVALIDATE_AFTER:
+        return 0
+    resp = transport.get(url, stream=True, headers=cache.validators(url))
+    try:
+        if resp.status_code == 304:
+            cache.touch(url)
+            return 0
+        if not resp.ok:
+            raise PictureError(resp.text)
+        digest = hashlib.sha1()
+        size = 0
+        fd, path = tempfile.mkstemp(prefix=_DOWNLOAD_PREFIX, dir=IMG_DIR)
+        with os.fdopen(fd, 'wb') as out_file:
+            for chunk in resp.iter_content(64 * 1024):
+                digest.update(chunk)
+                out_file.write(chunk)
+                size += len(chunk)
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+    finally:
+        resp.close()
+    digest = digest.hexdigest()
+    picture = None
+    try:
+        if not cache.has_content(digest):
+            picture = _prepare_picture(path, IMG_DIR)
+    finally:
+        os.remove(path)
+    cache.put(url, digest, picture, etag, last_modified)
+    return size
+
+
+def _prepare_picture(path, dir_):
+    """Saves the display file of the downloaded picture under a temporary
+    name in dir_, PictureCache.put gives it its final name."""
     try:
         image = Image.open(path)
+        image.thumbnail((int(MAX_WIDTH), int(MAX_HEIGHT)), Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA') or \
+                (image.mode == 'P' and 'transparency' in image.info):
+            image, extension, format_ = image.convert('RGBA'), '.png', 'PNG'
+        else:
+            image, extension, format_ = image.convert('RGB'), '.jpg', 'JPEG'
+        fd, display_path = tempfile.mkstemp(
+            prefix=_DOWNLOAD_PREFIX, suffix=extension, dir=dir_)
+        with os.fdopen(fd, 'wb') as display_file:
+            image.save(display_file, format_, quality=90)
     except IOError as e:
-        raise PictureError(e.message)
-    width, height = image.size
+        raise PictureError(str(e))
+    return _fit(display_path, *image.size)
+
+
+def _fit(path, width, height):
+    width, height = float(width), float(height)
     if width > MAX_WIDTH:
         height *= (MAX_WIDTH / width)
         width *= (MAX_WIDTH / width)
@@ -68,3 +325,12 @@ def get_picture(name):
     x = SCREEN_WIDTH / 2 - width / 2
     y = SCREEN_HEIGHT / 2 - height / 2
     return Picture(path, int(x), int(y), int(width), int(height))
+
+
+@timing.timed('get_picture')
+def get_picture(url):
+    # type: (str) -> Picture
+    picture = _get_cache().get(url)
+    if picture is None:
+        raise PictureError('Not downloaded: {}'.format(url))
+    return picture
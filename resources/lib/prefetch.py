@@ -0,0 +1,93 @@
+import itertools
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .pictures import PictureError
+
+logger = logging.getLogger(__name__)
+
+_STOP = float('-inf')
+_NOT_QUEUED = float('inf')
+
+
+class PicturePrefetcher(object):
+    """Downloads pictures on a small pool of worker threads.
+
+    Jobs are picture URLs, lower priorities are fetched first. A picture is
+    fetched once, asking for it again only moves it forward in the queue.
+    ``wait`` blocks until one picture is on disk.
+    """
+
+    def __init__(self, download, workers=3):
+        self._download = download
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._priorities = {}
+        self._running = set()
+        self._done = {}
+        self._errors = {}
+        self._threads = [
+            threading.Thread(target=self._run)
+            for _ in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def request(self, urls, priority):
+        with self._lock:
+            for url in urls:
+                if url not in self._done:
+                    self._done[url] = threading.Event()
+                elif self._done[url].is_set() or url in self._running or \
+                        self._priorities.get(url, _NOT_QUEUED) <= priority:
+                    continue
+                self._priorities[url] = priority
+                self._queue.put((priority, next(self._seq), url))
+
+    def wait(self, url, timeout=None):
+        """Fetches the picture next if it is not there yet and waits for it.
+
+        Raises PictureError if the download failed, whatever went wrong.
+        """
+        self.request([url], -1)
+        with self._lock:
+            done = self._done[url]
+        done.wait(timeout)
+        with self._lock:
+            error = self._errors.get(url)
+        if error is not None:
+            raise error
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put((_STOP, next(self._seq), None))
+
+    def _run(self):
+        while True:
+            priority, _, url = self._queue.get()
+            if priority == _STOP:
+                return
+            with self._lock:
+                if self._done[url].is_set() or \
+                        self._priorities.get(url) != priority:
+                    continue
+                del self._priorities[url]
+                self._running.add(url)
+            try:
+                self._download(url)
+            except Exception as e:
+                logger.warning('Could not download %s: %s', url, e)
+                if not isinstance(e, PictureError):
+                    e = PictureError(str(e))
+                with self._lock:
+                    self._errors[url] = e
+            with self._lock:
+                self._running.discard(url)
+                self._done[url].set()
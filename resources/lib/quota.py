@@ -0,0 +1,166 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(object):
+    """Counts the foreground callers waiting for any of the buckets that
+    share it."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.foreground_waiting = 0
+
+
+class TokenBucket(object):
+    """Allows ``rate`` requests per second with bursts of ``capacity``.
+
+    Foreground callers are served before background ones: a background
+    caller only gets a token when no foreground caller is waiting, for this
+    bucket or another one sharing its priority.
+    """
+
+    def __init__(self, rate, capacity, priority=None):
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.time()
+        self._priority = priority or Priority()
+
+    def acquire(self, foreground=True):
+        """Takes a token, returns the seconds spent waiting for it."""
+        start = time.time()
+        priority = self._priority
+        with priority.cond:
+            if foreground:
+                priority.foreground_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1 and \
+                            (foreground or not priority.foreground_waiting):
+                        self._tokens -= 1
+                        break
+                    priority.cond.wait(
+                        max(0.01, (1 - self._tokens) / self._rate))
+            finally:
+                if foreground:
+                    priority.foreground_waiting -= 1
+                priority.cond.notify_all()
+        return time.time() - start
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class RequestScheduler(object):
+    """Sends Sheets API requests within the per-user quota.
+
+    Reads and writes have their own token bucket, as they have their own
+    quota. Requests are foreground, reads unless sent with background=True,
+    or background, writes and background reads, which wait while a
+    foreground one waits. Transient failures (429, 5xx, connection errors)
+    are retried with jittered exponential backoff, honouring Retry-After. A
+    foreground request may be waited for on the UI thread, it gets
+    ``foreground_retries`` retries of at most ``max_foreground_delay``
+    seconds and fails rather than wait longer, a background one up to
+    ``max_retries`` of ``max_delay``.
+    """
+
+    _RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, transport, reads_per_minute=60, writes_per_minute=60,
+                 max_retries=5, base_delay=1.0, max_delay=32.0,
+                 foreground_retries=2, max_foreground_delay=2.0):
+        self._transport = transport
+        priority = Priority()
+        self._reads = TokenBucket(
+            reads_per_minute / 60.0, reads_per_minute / 6.0, priority)
+        self._writes = TokenBucket(
+            writes_per_minute / 60.0, writes_per_minute / 6.0, priority)
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._foreground_retries = foreground_retries
+        self._max_foreground_delay = max_foreground_delay
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0.0
+        self.dropped = 0
+
+    @property
+    def stats(self):
+        # type: () -> dict
+        with self._lock:
+            return {
+                'retries': self.retries,
+                'throttled': round(self.throttled, 3),
+                'dropped': self.dropped
+            }
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, write=False, **kwargs):
+        return self.request('POST', url, write=write, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, write=True, **kwargs)
+
+    def request(self, method, url, write=False, background=None, **kwargs):
+        bucket = self._writes if write else self._reads
+        background = write if background is None else background
+        max_retries = self._max_retries if background \
+            else self._foreground_retries
+        max_delay = self._max_delay if background \
+            else self._max_foreground_delay
+        attempt = 0
+        while True:
+            waited = bucket.acquire(foreground=not background)
+            self._count(throttled=waited)
+            retry_after = None
+            try:
+                resp = self._transport.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= max_retries:
+                    self._count(dropped=1)
+                    raise
+                logger.debug('%s %s failed: %s', method, url, e)
+            else:
+                if resp.status_code not in self._RETRY_STATUSES:
+                    return resp
+                if attempt >= max_retries:
+                    self._count(dropped=1)
+                    return resp
+                retry_after = resp.headers.get('Retry-After')
+                logger.debug('%s %s returned %d', method, url, resp.status_code)
+            attempt += 1
+            delay = self._backoff(attempt, retry_after, max_delay)
+            if not background and delay > max_delay:
+                # Not worth keeping the user waiting for
+                self._count(dropped=1)
+                return resp
+            self._count(retries=1)
+            time.sleep(delay)
+
+    def _backoff(self, attempt, retry_after, max_delay):
+        delay = min(max_delay, self._base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        try:
+            return max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            return delay
+
+    def _count(self, retries=0, throttled=0.0, dropped=0):
+        with self._lock:
+            self.retries += retries
+            self.throttled += throttled
+            self.dropped += dropped
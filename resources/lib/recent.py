@@ -0,0 +1,32 @@
+import time
+
+from . import files
+
+
+class RecentDecks(object):
+    """When each worksheet was last opened, kept on disk for the sync
+    service."""
+
+    def __init__(self, path):
+        self._path = path
+
+    def opened(self, sheet_names):
+        opened_at = self._read()
+        now = time.time()
+        for sheet_name in sheet_names:
+            opened_at[sheet_name] = now
+        files.write_json(self._path, opened_at)
+
+    def get(self, since):
+        # type: (float) -> list
+        """Returns the worksheets opened since then, the latest first."""
+        opened_at = self._read()
+        return sorted(
+            (name for name, at in opened_at.items() if at >= since),
+            key=lambda name: -opened_at[name])
+
+    def _read(self):
+        try:
+            return files.read_json(self._path) or {}
+        except ValueError:
+            return {}
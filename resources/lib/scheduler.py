@@ -0,0 +1,86 @@
+from collections import deque
+import heapq
+import random
+import threading
+import time
+
+
+def overdueness(card, now):
+    # type: (Card, float) -> float
+    """How late the review is, relative to the card's interval."""
+    days = (now - card.next_practice) / 86400.0
+    return days / max(card.interval, 1.0)
+
+
+class ReviewScheduler(object):
+    """Hands out the due cards of a session one at a time.
+
+    Review cards come most overdue first, new cards (never practised) in
+    sheet order, one new card after every ``reviews_per_new`` reviews.
+    ``max_reviews`` and ``max_new`` cap the session, 0 means no limit.
+    Cards that arrive while the session runs can be added from another
+    thread. Lapsed cards put back with ``relearn`` come before the others
+    once they are due again, or early if asked for when nothing else is
+    left.
+    """
+
+    def __init__(self, cards, now, max_reviews=0, max_new=0, reviews_per_new=4):
+        self._lock = threading.Lock()
+        self._reviews = []
+        self._new = deque()
+        self._relearning = []
+        self._reviews_left = max_reviews or float('inf')
+        self._new_left = max_new or float('inf')
+        self._reviews_per_new = reviews_per_new
+        self._since_new = 0
+        self.add(cards, now)
+
+    def __len__(self):
+        with self._lock:
+            return int(min(len(self._reviews), self._reviews_left) +
+                       min(len(self._new), self._new_left) +
+                       len(self._relearning))
+
+    def add(self, cards, now):
+        """Adds due cards, new ones go after the new cards already queued."""
+        new = []
+        with self._lock:
+            for card in cards:
+                if card.first_practice:
+                    heapq.heappush(self._reviews, (
+                        -overdueness(card, now), random.random(), card))
+                else:
+                    new.append(card)
+            new.sort(key=lambda card: card.idx)
+            self._new.extend(new)
+
+    def relearn(self, card, due_at):
+        """Puts a card back into the session, to be shown at due_at."""
+        with self._lock:
+            heapq.heappush(self._relearning, (due_at, random.random(), card))
+
+    def next(self, now=None, early=False):
+        # type: (float, bool) -> Card
+        """Returns the next card, None if there is none to show now.
+
+        With early, a relearning card that is not due yet is returned rather
+        than None, the session is over only when None is returned then.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._relearning and self._relearning[0][0] <= now:
+                return heapq.heappop(self._relearning)[2]
+            can_review = self._reviews and self._reviews_left > 0
+            can_new = self._new and self._new_left > 0
+            if can_new and (not can_review or
+                            self._since_new >= self._reviews_per_new):
+                self._new_left -= 1
+                self._since_new = 0
+                return self._new.popleft()
+            if can_review:
+                self._reviews_left -= 1
+                self._since_new += 1
+                return heapq.heappop(self._reviews)[2]
+            if self._relearning and early:
+                return heapq.heappop(self._relearning)[2]
+            return None
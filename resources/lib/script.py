@@ -3,19 +3,43 @@
 from datetime import datetime,  timedelta
 import logging
 import os
-import random
-import requests
 import shutil
+import sqlite3
 import threading
+import time
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 import xbmc
 import xbmcaddon
 import xbmcgui
 
+from resources.lib import backend
 from resources.lib import card
 from resources.lib import kodiutils
 from resources.lib import kodilogging
-from resources.lib import sheet
-from resources.lib import pictures
+from resources.lib import prefetch
+from resources.lib import recent
+from resources.lib import sheetlist
+from resources.lib import startup
+from resources.lib import store
+from resources.lib import sync
+from resources.lib import timing
+from resources.lib import writer
+from resources.lib import DATA_DIR
+from resources.lib import RUNNING_PROPERTY
+from resources.lib import make_dirs
+
+# Imported on first use, so the first window shows before PIL, NumPy and
+# the network stack are loaded
+forecast = startup.LazyModule('resources.lib.forecast')
+localdeck = startup.LazyModule('resources.lib.localdeck')
+pictures = startup.LazyModule('resources.lib.pictures')
+requests = startup.LazyModule('requests')
+scheduler = startup.LazyModule('resources.lib.scheduler')
+sheet = startup.LazyModule('resources.lib.sheet')
+transport = startup.LazyModule('resources.lib.transport')
 
 
 ADDON = xbmcaddon.Addon()
@@ -24,11 +48,201 @@ CWD = ADDON.getAddonInfo('path').decode('utf-8')
 
 logger = logging.getLogger(ADDON.getAddonInfo('id'))
 
+# The key of the cached worksheet list of the local decks
+LOCAL_DECKS_ID = 'local'
+
+# Seconds after which a worksheet with nothing due is synced anyway
+RESYNC_IDLE_AFTER = 86400
+
+
+class Context(object):
+    """What the windows share.
+
+    The local store is opened right away, the transport, the sheet and the
+    writer on first use. sheet is the deck backend, a
+    Google spreadsheet or the local decks, each has a store of its own.
+    """
+
+    def __init__(self, client_id, client_secret, sheet_id,
+                 deck_backend=backend.GOOGLE):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._sheet_id = sheet_id
+        self._deck_backend = deck_backend
+        prefix = backend.data_prefix(deck_backend)
+        make_dirs()
+        self.store = store.CardStore(
+            os.path.join(DATA_DIR, prefix + 'cards.db'))
+        self.sheet_list = sheetlist.SheetListCache(
+            os.path.join(DATA_DIR, 'sheet_names.json'), sheet_id)
+        self.recent_decks = recent.RecentDecks(
+            os.path.join(DATA_DIR, prefix + 'recent_decks.json'))
+        self._lock = threading.Lock()
+        self._transport = None
+        self._sheet = None
+        self._writer = None
+        self._threads = []
+        self._threads_lock = threading.Lock()
+        # Counts the logins the user cancelled
+        self._login_cancels = 0
+
+    @property
+    def transport(self):
+        self.connect()
+        return self._transport
+
+    @property
+    def sheet(self):
+        self.connect()
+        return self._sheet
+
+    @property
+    def writer(self):
+        self.connect()
+        return self._writer
+
+    def connect(self):
+        """Sets up the network side, raises SheetError if the sheet cannot
+        be authorised."""
+        # A connect that waited for a login the user cancelled gives up with
+        # it, a later one asks again
+        login_cancels = self._login_cancels
+        with self._lock:
+            if self._writer is not None:
+                return
+            if self._login_cancels != login_cancels:
+                raise sheet.SheetError('The login was cancelled')
+            if self._transport is None:
+                pool_size = kodiutils.get_setting_as_int('http_pool_size') or 4
+                self._transport = transport.Transport(
+                    pool_connections=pool_size, pool_maxsize=pool_size,
+                    timeout=kodiutils.get_setting_as_int('http_timeout') or 30)
+            if self._deck_backend == backend.LOCAL:
+                self._sheet = localdeck.LocalDecks(
+                    os.path.join(DATA_DIR, 'decks.db'))
+            else:
+                self._sheet = sheet.GoogleSheets(
+                    self._client_id, self._client_secret, self._sheet_id,
+                    self._transport, login=self._login)
+            self._writer = writer.CardWriter(
+                self._sheet, on_error=on_write_error,
+                on_written=self.store.mark_clean)
+            # Reviews whose write-back did not make it in an earlier run are
+            # still dirty in the store, a sync merges and pushes them
+            dirty_sheets = self.store.get_dirty_sheets()
+            if dirty_sheets:
+                self.run_in_background(self._push_dirty, dirty_sheets)
+
+    @property
+    def needs_login(self):
+        return self._deck_backend == backend.GOOGLE and \
+            not os.path.exists(os.path.join(DATA_DIR, 'creds.json'))
+
+    def run_in_background(self, target, *args):
+        """Runs target on a thread of its own, close waits for it before it
+        closes the store."""
+        thread = threading.Thread(target=target, args=args)
+        with self._threads_lock:
+            self._threads = [
+                running for running in self._threads if running.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+
+    def connect_in_background(self):
+        """Connects while the windows load, a login the device needs is
+        asked for right away."""
+        thread = threading.Thread(target=self._connect_quietly)
+        thread.daemon = True
+        thread.start()
+
+    def _connect_quietly(self):
+        try:
+            self.connect()
+        except (backend.DeckError, requests.RequestException) as e:
+            logger.warning('Could not connect: %s', e)
+
+    def _push_dirty(self, sheet_names):
+        try:
+            sync.sync_sheets(self._sheet, self.store, sheet_names)
+        except (backend.DeckError, requests.RequestException) as e:
+            logger.warning('Could not push the reviews of %s: %s',
+                           sheet_names, e)
+
+    def _login(self, tokens):
+        """Logs the device in with a cancellable progress dialog, which shows
+        the code to type and counts down until it expires."""
+        progress = xbmcgui.DialogProgress()
+        monitor = xbmc.Monitor()
+        expiry = {}
+
+        def show_code(verification_url, user_code, expires_in):
+            expiry['at'] = time.time() + expires_in
+            expiry['in'] = float(expires_in)
+            progress.create('Login', 'Please visit {} and type code {}'.format(
+                verification_url, user_code))
+
+        def wait(seconds):
+            until = time.time() + seconds
+            while time.time() < until:
+                if progress.iscanceled() or monitor.abortRequested():
+                    self._login_cancels += 1
+                    return False
+                left = max(0, expiry['at'] - time.time())
+                progress.update(int(100 * left / expiry['in']))
+                monitor.waitForAbort(0.2)
+            return True
+
+        try:
+            tokens.login(show_code, wait)
+        finally:
+            progress.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        with self._threads_lock:
+            threads = self._threads
+            self._threads = []
+        for thread in threads:
+            thread.join()
+        self.store.close()
+        if self._sheet is not None:
+            logger.debug('HTTP stats: %s, Sheets API stats: %s',
+                         self._transport.stats, self._sheet.request_stats)
+            self._sheet.close()
+        if self._transport is not None:
+            self._transport.close()
+
 
 class MainWindow(xbmcgui.WindowXML):
     def __init__(self, *args, **kwargs):
-        self.sheet = kwargs['sheet']
-        self.selected_sheet = kwargs['selected_sheet']
+        self.context = kwargs['context']
+        self.sheet = self.context.sheet
+        self.store = self.context.store
+        self.transport = self.context.transport
+        self.sheet_names = kwargs['sheet_names']
+        self.cards = []
+        self.scheduler = None
+        self.stream_error = None
+        self.idx = 0
+        # Lapsed cards of the session by row, with their relearning step
+        self.relearning = {}
+        self.relearn_steps = get_relearn_steps()
+        self.prefetch_ahead = kodiutils.get_setting_as_int('prefetch_ahead') or 5
+        self.picture_cache_bytes = (kodiutils.get_setting_as_int(
+            'picture_cache_mb') or 200) * 1024 * 1024
+        self.prefetcher = prefetch.PicturePrefetcher(
+            self.download_picture,
+            workers=kodiutils.get_setting_as_int('prefetch_workers') or 3)
+        self.writer = self.context.writer
+        self.writer.on_change = self.update_progress_label
+        # Pictures of the upcoming transitions, looked up and loaded into
+        # the hidden warm-up controls while the user is thinking
+        self.prepared = {}
+        self.render_queue = queue.Queue()
+        self.render_thread = threading.Thread(target=self.render_ahead_loop)
+        self.render_thread.daemon = True
+        self.render_thread.start()
 
     def onInit(self):
         self.mid_label = self.getControl(1)
@@ -37,6 +251,7 @@ class MainWindow(xbmcgui.WindowXML):
         self.score_row = self.getControl(30)
         self.highlight = self.getControl(31)
         self.score_label = self.getControl(32)
+        self.warm_up = [self.getControl(4), self.getControl(5)]
 
         self.answer_shown = False
         self.score_row.setPosition(0, 1016)  # hack, see comment in the XML
@@ -57,10 +272,15 @@ class MainWindow(xbmcgui.WindowXML):
             pass
         elif action.getId() == xbmcgui.ACTION_SELECT_ITEM:
             if self.idx >= len(self.cards):
+                # Cards may have arrived since the session ran out
+                self.prefetch()
+                if self.idx < len(self.cards):
+                    self.show_question()
                 return
             if self.answer_shown:
                 self.update_current_card()
                 self.idx += 1
+                self.prefetch()
                 self.show_question()
             else:
                 self.show_answer()
@@ -68,39 +288,97 @@ class MainWindow(xbmcgui.WindowXML):
             super(MainWindow, self).onAction(action)
 
     def start_game(self):
+        """Starts the session from the store. Worksheets that are not there
+        yet are streamed in, the first card is shown as soon as one is due.
+        """
         xbmc.executebuiltin('ActivateWindow(busydialognocancel)')
         try:
-            self.cards = [
-                card
-                for card in self.sheet.get_cards(self.selected_sheet)
-                if card.next_practice < datetime.now().isoformat()
-            ]
-            random.shuffle(self.cards)
-        except sheet.SheetError as se:
-            set_label(self.mid_label,
-                'Could not fetch the given Google sheet. Error: {}'.format(se.message))
-        else:
+            known = [
+                name for name in self.sheet_names if self.store.has_sheet(name)]
+            new_sheets = [
+                name for name in self.sheet_names if name not in known]
+            now = time.time()
+            idle = idle_sheets(self.store, known, now)
+            to_sync = [name for name in known if name not in idle]
+            self.scheduler = scheduler.ReviewScheduler(
+                self.store.get_due_cards(known, now) if known else [],
+                now,
+                max_reviews=kodiutils.get_setting_as_int('max_reviews'),
+                max_new=kodiutils.get_setting_as_int('max_new'),
+                reviews_per_new=kodiutils.get_setting_as_int(
+                    'reviews_per_new') or 4)
+            if to_sync:
+                self.context.run_in_background(self.sync_sheets, to_sync)
+            if new_sheets:
+                ready = threading.Event()
+                self.context.run_in_background(
+                    self.stream_sheets, new_sheets, ready)
+                if not len(self.scheduler):
+                    ready.wait()
+            if self.stream_error is not None and not len(self.scheduler):
+                set_label(self.mid_label,
+                    'Could not fetch the given Google sheet. Error: {}'.format(
+                        self.stream_error))
+                return
             self.idx = 0
-            self.download_pictures()
+            self.prefetch()
             self.show_question()
         finally:
             xbmc.executebuiltin('Dialog.Close(busydialognocancel)')
 
-    def download_pictures(self):
-        picture_urls = [
-            (card.question_picture, '{}/q{}'.format(self.selected_sheet, card.idx))
-            for card in self.cards
-            if card.question_picture
-        ] + [
-            (card.answer_picture, '{}/a{}'.format(self.selected_sheet, card.idx))
-            for card in self.cards
-            if card.answer_picture
-        ]
-        for picture_url, name in picture_urls:
-            try:
-                pictures.download_picture(picture_url, name)
-            except pictures.PictureError as pe:
-                show_notification(pe.message)
+    def sync_sheets(self, sheet_names):
+        try:
+            sync.sync_sheets(self.sheet, self.store, sheet_names)
+        except (backend.DeckError, requests.RequestException) as e:
+            logger.warning('Could not sync %s: %s', sheet_names, e)
+
+    def stream_sheets(self, sheet_names, ready):
+        """Streams the worksheets into the store and the session, sets
+        ready once a card is due or the worksheets are done."""
+        def on_cards(cards):
+            now = time.time()
+            self.scheduler.add(
+                [card for card in cards if card.next_practice < now], now)
+            if len(self.scheduler):
+                ready.set()
+            self.update_progress_label()
+
+        try:
+            sync.stream_sheets(self.sheet, self.store, sheet_names, on_cards)
+        except (backend.DeckError, requests.RequestException) as e:
+            logger.warning('Could not fetch %s: %s', sheet_names, e)
+            self.stream_error = e
+        finally:
+            ready.set()
+
+    def fill_cards(self):
+        """Takes cards from the scheduler up to the prefetch horizon.
+
+        A relearning card comes before its step is over only when the
+        session would end otherwise.
+        """
+        while len(self.cards) <= self.idx + self.prefetch_ahead:
+            card = self.scheduler.next(early=self.idx >= len(self.cards))
+            if card is None:
+                break
+            self.cards.append(card)
+
+    def prefetch(self):
+        self.fill_cards()
+        upcoming = self.cards[self.idx:self.idx + self.prefetch_ahead + 1]
+        for i, card in enumerate(upcoming):
+            urls = [
+                url for url in (card.question_picture, card.answer_picture)
+                if url
+            ]
+            self.prefetcher.request(urls, self.idx + i)
+
+    def download_picture(self, url):
+        try:
+            pictures.download_picture(
+                self.transport, url, self.picture_cache_bytes)
+        except requests.RequestException as e:
+            raise pictures.PictureError(str(e))
 
     @property
     def score(self):
@@ -121,6 +399,7 @@ class MainWindow(xbmcgui.WindowXML):
         self._answer_shown = v
         self.score_row.setVisible(self._answer_shown)
 
+    @timing.timed('show_question')
     def show_question(self):
         self.answer_shown = False
         self.picture.setVisible(False)
@@ -134,10 +413,12 @@ class MainWindow(xbmcgui.WindowXML):
         card = self.cards[self.idx]
         set_label(self.mid_label, card.question)
         if card.question_picture:
-            self.show_picture('{}/q{}'.format(self.selected_sheet, card.idx))
+            self.show_picture(card.question_picture)
         else:
             self.hide_picture()
+        self.render_ahead()
 
+    @timing.timed('show_answer')
     def show_answer(self):
         self.answer_shown = True
         self.picture.setVisible(False)
@@ -146,14 +427,54 @@ class MainWindow(xbmcgui.WindowXML):
         set_label(self.mid_label, card.answer)
         self.score = 3
         if card.answer_picture:
-            self.show_picture('{}/a{}'.format(self.selected_sheet, card.idx))
+            self.show_picture(card.answer_picture)
         else:
             self.hide_picture()
 
-    def show_picture(self, name):
+    def render_ahead(self):
+        """Prepares the pictures of the current card's answer and of the
+        next card's question in the background."""
+        urls = []
+        if self.idx < len(self.cards):
+            urls.append(self.cards[self.idx].answer_picture)
+        if self.idx + 1 < len(self.cards):
+            urls.append(self.cards[self.idx + 1].question_picture)
+        self.render_queue.put(urls)
+
+    def render_ahead_loop(self):
+        while True:
+            urls = self.render_queue.get()
+            # Only the latest request matters
+            while urls is not None and not self.render_queue.empty():
+                urls = self.render_queue.get()
+            if urls is None:
+                return
+            prepared = {}
+            for control, url in zip(self.warm_up, urls):
+                if not url:
+                    continue
+                picture = self.prepared.get(url)
+                if picture is None:
+                    try:
+                        self.prefetcher.wait(url)
+                        picture = pictures.get_picture(url)
+                    except pictures.PictureError:
+                        continue
+                prepared[url] = picture
+                # Loads the texture, the control itself is transparent
+                control.setImage(picture.path)  # pylint:disable=no-member
+            self.prepared = prepared
+
+    def stop_render_ahead(self):
+        self.render_queue.put(None)
+
+    def show_picture(self, url):
         self.mid_label.setPosition(0, 64)
         try:
-            picture = pictures.get_picture(name)
+            picture = self.prepared.get(url)
+            if picture is None:
+                self.prefetcher.wait(url)
+                picture = pictures.get_picture(url)
             self.picture.setImage(picture.path)  # pylint:disable=no-member
             self.picture.setPosition(picture.x, picture.y)
             self.picture.setWidth(picture.width)
@@ -167,60 +488,212 @@ class MainWindow(xbmcgui.WindowXML):
         self.mid_label.setPosition(0, 500)
 
     def update_current_card(self):
+        """Scores the current card. A lapsed card goes through the relearning
+        steps in memory, only its final state is saved and written back."""
         card = self.cards[self.idx]
-        card.update(self.score)
-        threading.Thread(target=self.update_card, args=(card,)).start()
+        key = (card.sheet, card.idx)
+        if key not in self.relearning:
+            card.update(self.score)
+            if self.score < 3 and self.relearn_steps:
+                # Saved, not yet written back: the lapse is not lost if the
+                # session does not end cleanly
+                self.store_card(card)
+                self.relearn(card, 0)
+                return
+        else:
+            _, step = self.relearning.pop(key)
+            if self.score < 3:
+                self.relearn(card, 0)
+                return
+            if step + 1 < len(self.relearn_steps):
+                self.relearn(card, step + 1)
+                return
+            card.relearned()
+        self.save_card(card)
+
+    def relearn(self, card, step):
+        self.relearning[(card.sheet, card.idx)] = (card, step)
+        self.scheduler.relearn(
+            card, time.time() + self.relearn_steps[step] * 60)
 
-    def update_card(self, card):
+    def save_card(self, card):
+        self.store_card(card)
+        self.writer.put(card.sheet, card)
+
+    def store_card(self, card):
         try:
-            self.sheet.update_card(self.selected_sheet, card)
-        except sheet.SheetError as se:
-            logger.warning(se.message)
-            show_notification('Could not update the question')
+            self.store.save_card(card.sheet, card)
+        except sqlite3.OperationalError as e:
+            # Locked by the sync service for too long. A review that is
+            # written back comes into the store with the next sync.
+            logger.warning('Could not save the review of %s row %d: %s',
+                           card.sheet, card.idx, e)
+
+    def finish_relearning(self):
+        """Saves the cards still relearning when the session ends, in the
+        state of their lapse."""
+        for card, _ in self.relearning.values():
+            self.save_card(card)
+        self.relearning = {}
 
     def update_progress_label(self):
-        text = '{} / {} '.format(self.idx + 1, len(self.cards)) \
+        total = len(self.cards)
+        if self.scheduler is not None:
+            total += len(self.scheduler)
+        text = '{} / {} '.format(self.idx + 1, total) \
             if self.idx < len(self.cards) else ''
+        pending = self.writer.pending
+        if pending:
+            text += '({} pending) '.format(pending)
         set_label(self.progress_label, text)
 
 
 class SelectSheetWindow(xbmcgui.WindowXML):
     def __init__(self, *args, **kwargs):
-        self.sheet = kwargs['sheet']
+        self.context = kwargs['context']
+        self.store = self.context.store
         self.sheet_names = []
 
     def onInit(self):
+        startup.mark('select sheet window shown')
         self.mid_label = self.getControl(1)
+        self.forecast_label = self.getControl(2)
 
         xbmc.executebuiltin('Container.SetViewMode(50)')
-        xbmc.executebuiltin('ActivateWindow(busydialognocancel)')
-        self.clearList()
 
-        try:
-            self.sheet_names = self.sheet.get_sheet_names()
-        except sheet.SheetError as se:
-            set_label(self.mid_label,
-                'Could not fetch the given Google sheet. Error: {}'.format(se.message))
-            return
-        finally:
-            xbmc.executebuiltin('Dialog.Close(busydialognocancel)')
+        # The cached worksheet list is shown at once and revalidated in the
+        # background, only the very first one is waited for
+        sheet_names = self.context.sheet_list.get()
+        if sheet_names is None:
+            try:
+                # A login dialog must not be hidden by the busy dialog
+                self.context.connect()
+                xbmc.executebuiltin('ActivateWindow(busydialognocancel)')
+                sheet_names = self.context.sheet.get_sheet_names()
+                self.context.sheet_list.put(sheet_names)
+            except (backend.DeckError, requests.RequestException) as e:
+                self.show_fetch_error(e)
+                return
+            finally:
+                xbmc.executebuiltin('Dialog.Close(busydialognocancel)')
+                startup.mark('sheet names fetched')
+        elif self.context.sheet_list.stale:
+            self.context.run_in_background(self.revalidate_sheet_names)
 
-        listitems = [
-            xbmcgui.ListItem(sheet_name)
-            for sheet_name in self.sheet_names
-        ]
-        self.addItems(listitems)
+        self.show_sheet_names(sheet_names)
         xbmc.sleep(100)
         self.setFocusId(self.getCurrentContainerId())
-
+        startup.mark('sheet list shown')
+        startup.report()
+        self.update_forecast()
 
     def onAction(self, action):
         if action.getId() == xbmcgui.ACTION_SELECT_ITEM:
-            selected_sheet = self.sheet_names[self.getCurrentListPosition()]
-            show_main_window(self.sheet, selected_sheet)
+            position = self.getCurrentListPosition()
+            if position == 0:
+                sheet_names = self.sheet_names
+            else:
+                sheet_names = [self.sheet_names[position - 1]]
+            if idle_sheets(self.store, sheet_names, time.time()) == \
+                    set(sheet_names):
+                # Known to have nothing due, no need to go to the network
+                show_notification(kodiutils.get_string(32100))
+                return
+            try:
+                show_main_window(self.context, sheet_names)
+            except (backend.DeckError, requests.RequestException) as e:
+                # The window needs the sheet, which may fail to connect
+                self.show_fetch_error(e)
+                return
+            self.show_sheet_names(self.sheet_names)
+            self.update_forecast()
         else:
             super(SelectSheetWindow, self).onAction(action)
 
+    def show_fetch_error(self, error):
+        set_label(self.mid_label,
+            'Could not fetch the given Google sheet. Error: {}'.format(error))
+
+    def revalidate_sheet_names(self):
+        try:
+            sheet_names = self.context.sheet.get_sheet_names()
+        except (backend.DeckError, requests.RequestException) as e:
+            logger.warning('Could not refresh the worksheet list: %s', e)
+            return
+        if self.context.sheet_list.put(sheet_names):
+            self.show_sheet_names(sheet_names)
+
+    def show_sheet_names(self, sheet_names):
+        """Fills the list with the worksheets and their due counts, keeping
+        the selected worksheet selected."""
+        position = self.getCurrentListPosition()
+        if 0 < position <= len(self.sheet_names) and \
+                self.sheet_names[position - 1] in sheet_names:
+            position = sheet_names.index(self.sheet_names[position - 1]) + 1
+        elif position > 0:
+            position = 0
+        now = time.time()
+        due = self.store.count_due(now, day_end(now))
+        self.sheet_names = sheet_names
+        synced = [due[name] for name in sheet_names if name in due]
+        listitems = [xbmcgui.ListItem(
+            kodiutils.get_string(32101),
+            due_label(map(sum, zip(*synced))) if synced else '')] + [
+            xbmcgui.ListItem(
+                sheet_name,
+                due_label(due[sheet_name]) if sheet_name in due else '')
+            for sheet_name in sheet_names
+        ]
+        self.clearList()
+        self.addItems(listitems)
+        if position > 0:
+            self.setCurrentListPosition(position)
+
+    def update_forecast(self):
+        self.context.run_in_background(self.show_forecast)
+
+    def show_forecast(self):
+        if not forecast.available:
+            return
+        states = self.store.get_states()
+        if not states:
+            return
+        due = forecast.forecast(
+            forecast.DeckArrays.from_states(states, time.time()))
+        set_label(self.forecast_label, 'Due per day, next {} days: {}'.format(
+            len(due), ' '.join(str(int(round(count))) for count in due)))
+
+
+def day_end(now):
+    """Returns the epoch seconds of the next local midnight."""
+    tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+    return time.mktime(tomorrow.timetuple())
+
+
+def get_relearn_steps():
+    """Returns the relearning steps in minutes from the settings."""
+    steps = []
+    for step in kodiutils.get_setting('relearn_steps').replace(',', ' ').split():
+        try:
+            steps.append(float(step))
+        except ValueError:
+            logger.warning('Invalid relearning step: %s', step)
+    return steps
+
+
+def idle_sheets(store, sheet_names, now):
+    """Returns the worksheets that have nothing due in the store and were
+    synced recently, they need neither a session nor a sync."""
+    due = store.count_due(now, now)
+    return set(
+        name for name in sheet_names
+        if name in due and not due[name][0] and
+        now - store.get_synced_at(name) <= RESYNC_IDLE_AFTER)
+
+
+def due_label(counts):
+    return kodiutils.get_string(32102).format(*counts)
+
 
 def set_label(control, text):
     control.setLabel(text)
@@ -236,36 +709,102 @@ def show_notification(text):
         pass
 
 
-def show_main_window(sheet_, selected_sheet):
+def show_main_window(context, sheet_names):
+    context.recent_decks.opened(sheet_names)
     main_window = MainWindow(
         'main-window.xml', CWD, 'default', '1080i', False,
-        sheet=sheet_, selected_sheet=selected_sheet)
+        context=context, sheet_names=sheet_names)
     main_window.doModal()
+    main_window.finish_relearning()
+    main_window.stop_render_ahead()
+    main_window.prefetcher.close()
+    main_window.writer.on_change = None
+    timing.timings.report(logger, os.path.join(DATA_DIR, 'stats.json'))
     del main_window
 
 
-def show_ui():
+def on_write_error(error):
+    show_notification('Could not update the question')
+
+
+def google_context():
+    """Returns the context of the Google spreadsheet in the settings, None
+    if a setting is missing."""
     client_id = kodiutils.get_setting('client_id')
     if not client_id:
         xbmcgui.Dialog().ok('Error', 'Google Client ID is missing. ',
             'Please update it in the settings and restart!')
-        return
+        return None
 
     client_secret = kodiutils.get_setting('client_secret')
     if not client_secret:
         xbmcgui.Dialog().ok('Error', 'Google Client secret is missing. ',
             'Please update it in the settings and restart!')
-        return
+        return None
 
     sheet_id = kodiutils.get_setting('sheet_id')
     if not sheet_id:
         xbmcgui.Dialog().ok('Error', 'Google Sheet ID is missing. ',
             'Please update it in the settings and restart!')
+        return None
+
+    return Context(client_id, client_secret, sheet_id)
+
+
+def show_ui():
+    if kodiutils.get_setting_as_int('backend') == backend.LOCAL:
+        context = Context(None, None, LOCAL_DECKS_ID, deck_backend=backend.LOCAL)
+    else:
+        context = google_context()
+        if context is None:
+            return
+    startup.mark('local store opened')
+    if context.needs_login:
+        # Logs in while the worksheets are loaded from the store
+        context.connect_in_background()
+    # The sync service keeps away while the script runs
+    home = xbmcgui.Window(10000)
+    home.setProperty(RUNNING_PROPERTY, 'true')
+    try:
+        select_sheet_window = SelectSheetWindow(
+            'select-sheet-window.xml', CWD, 'default', '1080i', True,
+            context=context)
+        select_sheet_window.doModal()
+        del select_sheet_window
+        context.close()
+    finally:
+        home.clearProperty(RUNNING_PROPERTY)
+
+
+def import_deck():
+    """Imports an Anki package or a CSV file into the local decks, the deck
+    is named after the file."""
+    heading = kodiutils.get_string(32016)
+    path = xbmcgui.Dialog().browse(1, heading, 'files', '.apkg|.csv|.tsv|.txt')
+    if not path:
         return
+    path = xbmc.translatePath(path).decode('utf-8')
+    sheet_name = os.path.splitext(os.path.basename(path))[0]
+    progress = xbmcgui.DialogProgress()
+    progress.create(heading, sheet_name)
 
-    _sheet = sheet.GoogleSheets(client_id, client_secret, sheet_id)
+    def on_progress(done, total):
+        progress.update(100 * done // total, sheet_name,
+                        '{} / {}'.format(done, total))
 
-    select_sheet_window = SelectSheetWindow(
-        'select-sheet-window.xml', CWD, 'default', '1080i', True, sheet=_sheet)
-    select_sheet_window.doModal()
-    del select_sheet_window
+    make_dirs()
+    decks = localdeck.LocalDecks(os.path.join(DATA_DIR, 'decks.db'))
+    try:
+        count = decks.import_deck(
+            sheet_name, localdeck.read_deck(path), on_progress)
+        sheetlist.SheetListCache(
+            os.path.join(DATA_DIR, 'sheet_names.json'),
+            LOCAL_DECKS_ID).put(decks.get_sheet_names())
+    except (backend.DeckError, IOError) as e:
+        progress.close()
+        xbmcgui.Dialog().ok('Error', 'Could not import the deck.', str(e))
+        return
+    finally:
+        decks.close()
+    progress.close()
+    show_notification(u'Imported {} cards into {}'.format(count, sheet_name))
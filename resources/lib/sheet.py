@@ -1,31 +1,46 @@
 from datetime import datetime
-import json
 import os
-import requests
-import time
-import xbmcgui
 
 from . import DATA_DIR
-from .card import Card
+from . import auth
+from . import quota
+from . import timing
+from .backend import DeckBackend, DeckError
+from .card import Card, format_time
 
-class SheetError(Exception):
+class SheetError(DeckError):
     pass
 
 
-class GoogleSheets(object):
+class GoogleSheets(DeckBackend):
 
     _BASE_URL = 'https://sheets.googleapis.com/v4/spreadsheets'
+    _RANGES_PER_REQUEST = 100
+    # Rows between two needed ones that are fetched along rather than
+    # starting a range of their own
+    _MAX_GAP = 50
+    # Beyond this many ranges the content of a worksheet is fetched whole
+    _MAX_RANGES = 20
 
-    def __init__(self, client_id, client_secret, sheet_id):
+    def __init__(self, client_id, client_secret, sheet_id, transport,
+                 login=None):
         self._client_id = client_id
         self._client_secret = client_secret
         self._sheet_id = sheet_id
-        self._cred_path = os.path.join(DATA_DIR, 'creds.json')
-        self._load_tokens()
+        self._requests = quota.RequestScheduler(transport)
+        try:
+            self._tokens = auth.TokenManager(
+                client_id, client_secret,
+                os.path.join(DATA_DIR, 'creds.json'), transport, login=login)
+        except auth.AuthError as e:
+            raise SheetError(str(e))
 
     def get_sheet_names(self):
         url = '{}/{}'.format(self._BASE_URL, self._sheet_id)
-        resp = requests.get(url, headers=self._headers)
+        # Only the titles, not the whole spreadsheet metadata
+        resp = self._requests.get(url, params={
+            'fields': 'sheets.properties.title'
+        }, headers=self._headers)
         self._check_resp(resp)
         sheets = resp.json()['sheets']
         return [
@@ -33,122 +48,225 @@ class GoogleSheets(object):
             for sheet in sheets
         ]
 
-    def get_cards(self, sheet_name):
-        url = '{}/{}/values/{}!A2:I'.format(self._BASE_URL, self._sheet_id, sheet_name)
-        resp = requests.get(url, headers=self._headers)
-        self._check_resp(resp)
-        rows = resp.json()['values']
+    def get_card_pages(self, sheet_name, page_rows=500, max_page_rows=16000):
+        """Fetches the worksheet in blocks of rows, yields (first row,
+        last row, cards) for each.
+
+        The first block is small, so its cards arrive early, the next ones
+        double up to max_page_rows. The API leaves out the empty rows at the
+        end of a range, so a block that comes back short is followed by one
+        open-ended range instead: it reads whatever comes after a gap of
+        empty rows, up to the end of the grid, and ends the worksheet.
+        """
+        first = 2
+        while True:
+            last = first + page_rows - 1
+            with timing.span('get_card_page'):
+                rows = self._batch_get(
+                    ['{}!A{}:I{}'.format(sheet_name, first, last)])[0]
+            yield first, last, self._to_cards(sheet_name, first, rows)
+            first = last + 1
+            if len(rows) < page_rows:
+                break
+            page_rows = min(page_rows * 2, max_page_rows)
+        with timing.span('get_card_page'):
+            rows = self._batch_get(['{}!A{}:I'.format(sheet_name, first)])[0]
+        if rows:
+            yield first, first + len(rows) - 1, self._to_cards(
+                sheet_name, first, rows)
+
+    def _to_cards(self, sheet_name, first, rows):
+        cards = []
         for i, row in enumerate(rows):
-            if len(row) < 7:
+            card = self._to_card(sheet_name, first + i, row)
+            if card is not None:
+                cards.append(card)
+        return cards
+
+    @timing.timed('get_cards')
+    def get_scheduled_cards(self, sheet_names, needs_content):
+        """Fetches the cards of worksheets in two phases, skipping content
+        that is not needed.
+
+        First the scheduling columns A-E of every row of every worksheet are
+        downloaded with one values:batchGet, then the content columns F-I
+        only of the rows for which needs_content(sheet_name, idx, schedule_row)
+        is true, plus every row after the last scheduled one. Runs of such
+        rows less than _MAX_GAP rows apart are fetched as one range, a
+        worksheet that would still need more than _MAX_RANGES ranges is
+        fetched whole. The other cards are returned with their question set
+        to None.
+
+        The requests are sent in the background: this is for syncing, the
+        reads of a session go first.
+
+        Returns the cards in a dict by worksheet name.
+        """
+        schedules = {}
+        for sheet_name, rows in zip(sheet_names, self._batch_get([
+                '{}!A2:E'.format(sheet_name) for sheet_name in sheet_names],
+                background=True)):
+            schedules[sheet_name] = [row + [''] * (5 - len(row)) for row in rows]
+
+        content_ranges = []
+        for sheet_name in sheet_names:
+            rows = [
+                2 + i
+                for i, row in enumerate(schedules[sheet_name])
+                if needs_content(sheet_name, 2 + i, row)
+            ]
+            runs = _runs(rows, self._MAX_GAP)
+            if len(runs) > self._MAX_RANGES:
+                content_ranges.append(
+                    ('{0}!F2:I'.format(sheet_name), sheet_name, 2))
                 continue
-            card = Card(
-                idx=2 + i, question=row[5], answer=row[6],
-                first_practice=row[0], next_practice=row[1],
-                streak=row[2], interval=row[3], easiness=row[4]
-            )
-            if len(row) > 7:
-                card.question_picture = row[7]
-            if len(row) > 8:
-                card.answer_picture = row[8]
-            yield card
+            for first, last in runs:
+                content_ranges.append((
+                    '{0}!F{1}:I{2}'.format(sheet_name, first, last),
+                    sheet_name, first))
+            tail = 2 + len(schedules[sheet_name])
+            content_ranges.append((
+                '{0}!F{1}:I'.format(sheet_name, tail), sheet_name, tail))
+
+        contents = dict((sheet_name, {}) for sheet_name in sheet_names)
+        values = self._batch_get(
+            [a1_range for a1_range, _, _ in content_ranges], background=True)
+        for (_, sheet_name, first), rows in zip(content_ranges, values):
+            for j, row in enumerate(rows):
+                contents[sheet_name][first + j] = row
+
+        return dict(
+            (sheet_name, self._merge_rows(
+                sheet_name, schedules[sheet_name], contents[sheet_name]))
+            for sheet_name in sheet_names
+        )
 
+    def _merge_rows(self, sheet_name, schedules, contents):
+        cards = []
+        for i, row in enumerate(schedules):
+            idx = 2 + i
+            if idx in contents:
+                card = self._to_card(sheet_name, idx, row + contents[idx])
+            else:
+                card = self._to_card(sheet_name, idx, row + [None, None])
+            if card is not None:
+                cards.append(card)
+        tail = 2 + len(schedules)
+        for idx in sorted(idx for idx in contents if idx >= tail):
+            card = self._to_card(sheet_name, idx, [''] * 5 + contents[idx])
+            if card is not None:
+                cards.append(card)
+        return cards
+
+    def _batch_get(self, a1_ranges, background=False):
+        """Returns the rows of each range, with as few requests as possible."""
+        url = '{}/{}/values:batchGet'.format(self._BASE_URL, self._sheet_id)
+        values = []
+        for i in range(0, len(a1_ranges), self._RANGES_PER_REQUEST):
+            chunk = a1_ranges[i:i + self._RANGES_PER_REQUEST]
+            resp = self._requests.get(
+                url, background=background, params={'ranges': chunk},
+                headers=self._headers)
+            self._check_resp(resp)
+            value_ranges = resp.json().get('valueRanges', [])
+            values.extend(
+                value_range.get('values', []) for value_range in value_ranges)
+        return values
+
+    @staticmethod
+    def _to_card(sheet_name, idx, row):
+        if len(row) < 7:
+            return None
+        card = Card(
+            idx=idx, question=row[5], answer=row[6],
+            first_practice=row[0], next_practice=row[1],
+            streak=row[2], interval=row[3], easiness=row[4]
+        )
+        card.sheet = sheet_name
+        if len(row) > 7:
+            card.question_picture = row[7]
+        if len(row) > 8:
+            card.answer_picture = row[8]
+        return card
+
+    @timing.timed('update_card')
     def update_card(self, sheet_name, card):
         # type: (card) -> None
         url = '{0}/{1}/values/{2}!A{3}:E{3}?valueInputOption=RAW'.format(
             self._BASE_URL, self._sheet_id, sheet_name, card.idx)
-        resp = requests.put(url, json={
-            'values': [
-                [
-                    card.first_practice,
-                    card.next_practice,
-                    card.streak,
-                    card.interval,
-                    card.easiness
-                ]
+        resp = self._requests.put(url, json={
+            'values': [self._card_values(card)]
+        }, headers=self._headers)
+        self._check_resp(resp)
+
+    @timing.timed('update_cards')
+    def update_cards(self, updates):
+        # type: (list) -> None
+        """Writes several cards with one values:batchUpdate request.
+
+        updates is a list of (sheet_name, card) pairs.
+        """
+        if not updates:
+            return
+        url = '{}/{}/values:batchUpdate'.format(self._BASE_URL, self._sheet_id)
+        resp = self._requests.post(url, write=True, json={
+            'valueInputOption': 'RAW',
+            'data': [
+                {
+                    'range': '{0}!A{1}:E{1}'.format(sheet_name, card.idx),
+                    'values': [self._card_values(card)]
+                }
+                for sheet_name, card in updates
             ]
         }, headers=self._headers)
         self._check_resp(resp)
 
-    @property
-    def _token(self):
-        if self._access_token_expires_at <= int(time.time()):
-            self._refresh_access_token()
-        return self._access_token
+    @staticmethod
+    def _card_values(card):
+        return [
+            format_time(card.first_practice),
+            format_time(card.next_practice),
+            card.streak,
+            card.interval,
+            card.easiness
+        ]
 
     @property
     def _headers(self):
+        try:
+            token = self._tokens.token
+        except auth.AuthError as e:
+            raise SheetError(str(e))
         return {
-            'Authorization': 'Bearer ' + self._token
+            'Authorization': 'Bearer ' + token
         }
 
+    # Bad ranges, like a renamed worksheet or a row outside the grid, and a
+    # spreadsheet that is gone
+    _PERMANENT_STATUSES = (400, 404)
+
     def _check_resp(self, resp):
         if not resp.ok:
-            raise SheetError(resp.text)
+            raise SheetError(
+                resp.text,
+                permanent=resp.status_code in self._PERMANENT_STATUSES)
 
-    def _save_tokens(self):
-        tokens = {
-            'access_token': self._access_token,
-            'expires_at': self._access_token_expires_at,
-            'refresh_token': self._refresh_token
-        }
-        with open(self._cred_path, mode='w') as cred_file:
-            json.dump(tokens, cred_file)
+    @property
+    def request_stats(self):
+        # type: () -> dict
+        return self._requests.stats
 
-    def _load_tokens(self):
-        if not os.path.exists(self._cred_path):
-            self._login()
-            return
-        with open(self._cred_path) as cred_file:
-            content = json.load(cred_file)
-        self._access_token = content['access_token']
-        self._access_token_expires_at = content['expires_at']
-        self._refresh_token = content['refresh_token']
-
-    def _login(self):
-        resp = requests.post('https://oauth2.googleapis.com/device/code', data={
-            'client_id': self._client_id,
-            'scope': 'https://www.googleapis.com/auth/spreadsheets'
-        })
-        self._check_resp(resp)
-        content = resp.json()
-
-        device_code = content['device_code']
-        user_code = content['user_code']
-        verification_url = content['verification_url']
-
-        message = 'Please visit {} and type code {}'.format(
-            verification_url, user_code)
-        # TODO: Replace with progress dialog and poll
-        xbmcgui.Dialog().ok('Login', message)
-
-        resp = requests.post('https://oauth2.googleapis.com/token', data={
-            'client_id': self._client_id,
-            'client_secret': self._client_secret,
-            'device_code': device_code,
-            'grant_type': 'urn:ietf:params:oauth:grant-type:device_code'
-        }, headers={
-            'Content-Type': 'application/x-www-form-urlencoded'
-        })
-        self._check_resp(resp)
-        content = resp.json()
-        self._access_token = content['access_token']
-        self._access_token_expires_at = int(
-            time.time()) + content['expires_in']
-        self._refresh_token = content['refresh_token']
-        self._save_tokens()
-
-    def _refresh_access_token(self):
-        resp = requests.post('https://oauth2.googleapis.com/token', data={
-            'client_id': self._client_id,
-            'client_secret': self._client_secret,
-            'refresh_token': self._refresh_token,
-            'grant_type': 'refresh_token'
-        }, headers={
-            'Content-Type': 'application/x-www-form-urlencoded'
-        })
-        self._check_resp(resp)
-        content = resp.json()
-        self._access_token = content['access_token']
-        self._access_token_expires_at = int(
-            time.time()) + content['expires_in']
-        self._save_tokens()
+    def close(self):
+        self._tokens.close()
+
+
+def _runs(rows, max_gap=0):
+    """Groups row indices into (first, last) runs of consecutive rows, or
+    of rows at most max_gap rows apart."""
+    runs = []
+    for idx in sorted(rows):
+        if runs and idx - runs[-1][1] <= max_gap + 1:
+            runs[-1][1] = idx
+        else:
+            runs.append([idx, idx])
+    return runs
@@ -0,0 +1,48 @@
+import time
+
+from . import files
+
+
+class SheetListCache(object):
+    """The worksheet titles of the spreadsheet, kept on disk.
+
+    The cached titles can be shown at once. Once they are older than ``ttl``
+    seconds they are stale and should be revalidated with the sheet.
+    """
+
+    def __init__(self, path, sheet_id, ttl=600):
+        self._path = path
+        self._sheet_id = sheet_id
+        self._ttl = ttl
+        try:
+            content = files.read_json(path)
+        except ValueError:
+            content = None
+        if content is not None and content.get('sheet_id') != sheet_id:
+            # Cached for another spreadsheet
+            content = None
+        self._content = content
+
+    def get(self):
+        # type: () -> list
+        """Returns the cached titles, None if there are none."""
+        if self._content is None:
+            return None
+        return self._content['names']
+
+    @property
+    def stale(self):
+        return self._content is None or \
+            time.time() - self._content['fetched_at'] > self._ttl
+
+    def put(self, names):
+        # type: (list) -> bool
+        """Stores freshly fetched titles, returns whether they changed."""
+        changed = names != self.get()
+        self._content = {
+            'sheet_id': self._sheet_id,
+            'names': names,
+            'fetched_at': time.time()
+        }
+        files.write_json(self._path, self._content)
+        return changed
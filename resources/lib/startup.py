@@ -0,0 +1,95 @@
+"""Fast startup: modules imported on first use, and the startup profile.
+
+With the startup_profile setting on, every module import and the steps
+marked with ``mark`` are timed from the launch, the timeline goes to the
+Kodi log when ``report`` is called.
+"""
+import importlib
+import sys
+import time
+
+import xbmc
+import xbmcaddon
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+# Imports faster than this are left out of the timeline
+_MIN_IMPORT_TIME = 0.001
+
+_started = time.time()
+_events = []
+_depth = [0]
+_builtin_import = None
+
+
+class LazyModule(object):
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def begin():
+    """Starts the profile if the startup_profile setting is on."""
+    global _builtin_import
+    if _builtin_import is not None or \
+            xbmcaddon.Addon().getSetting('startup_profile') != 'true':
+        return
+    _builtin_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def enabled():
+    return _builtin_import is not None
+
+
+def mark(label):
+    """Adds a step to the timeline."""
+    if enabled():
+        _events.append((time.time() - _started, 0.0, 0, label))
+
+
+def report():
+    """Writes the timeline to the log and ends the profile."""
+    global _builtin_import
+    if not enabled():
+        return
+    builtins.__import__ = _builtin_import
+    _builtin_import = None
+    prefix = '[{}] startup: '.format(xbmcaddon.Addon().getAddonInfo('id'))
+    for offset, duration, depth, label in sorted(_events):
+        xbmc.log('{}{:8.1f} ms {}{} ({:.1f} ms)'.format(
+            prefix, offset * 1000, '  ' * depth, label, duration * 1000),
+            xbmc.LOGNOTICE)
+    del _events[:]
+
+
+def _timed_import(name, *args, **kwargs):
+    modules = len(sys.modules)
+    start = time.time()
+    _depth[0] += 1
+    try:
+        return _builtin_import(name, *args, **kwargs)
+    finally:
+        _depth[0] -= 1
+        duration = time.time() - start
+        if len(sys.modules) > modules and duration >= _MIN_IMPORT_TIME:
+            _events.append((
+                start - _started, duration, _depth[0],
+                _import_label(name, *args, **kwargs)))
+
+
+def _import_label(name, globals=None, locals=None, fromlist=None, level=0):
+    if not fromlist:
+        return 'import ' + name
+    return 'from {}{} import {}'.format(
+        '.' * max(level, 0), name, ', '.join(fromlist))
@@ -0,0 +1,272 @@
+import json
+import sqlite3
+import threading
+
+from .card import Card
+
+_VERSION = 1
+
+# Seconds to wait for a lock on the file, the script and the sync service
+# share it
+_BUSY_TIMEOUT = 5.0
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cards (
+    sheet TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    question TEXT,
+    answer TEXT,
+    question_picture TEXT,
+    answer_picture TEXT,
+    first_practice REAL,
+    next_practice REAL NOT NULL DEFAULT 0,
+    streak INTEGER,
+    interval REAL,
+    easiness REAL,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    base TEXT,
+    PRIMARY KEY (sheet, idx)
+);
+CREATE INDEX IF NOT EXISTS cards_due ON cards (sheet, next_practice);
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet TEXT PRIMARY KEY,
+    synced_at REAL
+);
+'''
+
+_COLUMNS = (
+    'idx, question, answer, question_picture, answer_picture, '
+    'first_practice, next_practice, streak, interval, easiness')
+
+
+def _state(card):
+    return [
+        card.first_practice,
+        card.next_practice,
+        card.streak,
+        card.interval,
+        card.easiness
+    ]
+
+
+def _content(card):
+    return [
+        card.question,
+        card.answer,
+        card.question_picture,
+        card.answer_picture
+    ]
+
+
+class CardStore(object):
+    """Local SQLite copy of the decks, including their SM-2 state.
+
+    Reviews are saved here first and marked dirty until the sheet has
+    acknowledged them. ``base`` keeps the scheduling state the sheet had at
+    the last sync, so remote and local changes can be told apart.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn = sqlite3.connect(
+            path, timeout=_BUSY_TIMEOUT, check_same_thread=False)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != _VERSION:
+            # The store is a cache of the sheet, an old one is synced again
+            self._conn.executescript(
+                'DROP TABLE IF EXISTS cards; DROP TABLE IF EXISTS sheets;')
+            self._conn.execute('PRAGMA user_version = {}'.format(_VERSION))
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+    def has_sheet(self, sheet_name):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM sheets WHERE sheet = ?', (sheet_name,)).fetchone()
+        return row is not None
+
+    def get_rows(self, sheet_name):
+        # type: (str) -> set
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT idx FROM cards WHERE sheet = ?', (sheet_name,))
+            return set(row[0] for row in rows)
+
+    def get_states(self):
+        """Returns (next_practice, streak, interval, easiness) of every card."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT next_practice, streak, interval, easiness '
+                'FROM cards').fetchall()
+
+    def get_synced_at(self, sheet_name):
+        # type: (str) -> float
+        """Returns when the worksheet was last synced, None if never."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT synced_at FROM sheets WHERE sheet = ?',
+                (sheet_name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_dirty_sheets(self):
+        # type: () -> list
+        """Returns the worksheets with reviews the sheet does not have yet."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT sheet FROM cards WHERE dirty = 1 '
+                'ORDER BY sheet').fetchall()
+        return [row[0] for row in rows]
+
+    def count_due(self, now, day_end):
+        # type: (float, float) -> dict
+        """Returns the number of cards of every synced worksheet that are
+        due now and that are due by day_end, in (now, today) pairs.
+
+        Only the due part of the (sheet, next_practice) index is read, the
+        counts are up to date with every review and sync.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT sheets.sheet, '
+                'COALESCE(SUM(cards.next_practice < ?), 0), COUNT(cards.idx) '
+                'FROM sheets LEFT JOIN cards ON cards.sheet = sheets.sheet '
+                'AND cards.next_practice < ? GROUP BY sheets.sheet',
+                (now, day_end)).fetchall()
+        return dict((row[0], (row[1], row[2])) for row in rows)
+
+    def get_due_cards(self, sheet_names, now):
+        # type: (list, float) -> list
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT sheet, {} FROM cards WHERE sheet IN ({}) '
+                'AND next_practice < ? ORDER BY sheet, idx'.format(
+                    _COLUMNS, ', '.join('?' * len(sheet_names))),
+                list(sheet_names) + [now]).fetchall()
+        return [self._to_card(row[0], row[1:]) for row in rows]
+
+    def save_card(self, sheet_name, card):
+        """Saves a locally reviewed card, it stays dirty until mark_clean."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE cards SET first_practice = ?, next_practice = ?, '
+                'streak = ?, interval = ?, easiness = ?, dirty = 1 '
+                'WHERE sheet = ? AND idx = ?',
+                _state(card) + [sheet_name, card.idx])
+
+    def mark_clean(self, updates):
+        """Clears the dirty flag of rows the sheet has acknowledged.
+
+        Rows reviewed again since the write stay dirty. A write that ends
+        after the store was closed is not recorded, its rows are pushed
+        again on the next sync.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            with self._conn:
+                for sheet_name, card in updates:
+                    state = _state(card)
+                    self._conn.execute(
+                        'UPDATE cards SET dirty = 0, base = ? '
+                        'WHERE sheet = ? AND idx = ? AND first_practice IS ? '
+                        'AND next_practice = ? AND streak = ? '
+                        'AND interval = ? AND easiness = ?',
+                        [json.dumps(state), sheet_name, card.idx] + state)
+
+    def merge(self, sheet_name, remote_cards, synced_at, rows=None):
+        """Merges the cards pulled from the sheet into the store.
+
+        Only rows that differ from the stored copy are written. Content always
+        comes from the sheet, cards pulled without content (question is None)
+        keep the stored one. For the scheduling state a clean local row takes
+        the remote state, a dirty row keeps the local one unless the sheet was
+        changed since the last sync too. In that case the state with the later
+        next_practice wins, and the sheet on a tie.
+
+        rows, a (first, last) pair, limits the merge to that block of rows,
+        last None meaning the end of the worksheet. The worksheet counts as
+        synced once a merge reaches its end.
+
+        Returns the cards whose local state has to be pushed to the sheet.
+        """
+        to_push = []
+        first, last = rows or (0, None)
+        with self._lock, self._conn:
+            local = {
+                row[0]: row
+                for row in self._conn.execute(
+                    'SELECT {}, dirty, base FROM cards WHERE sheet = ? '
+                    'AND idx >= ? AND (? IS NULL OR idx <= ?)'.format(
+                        _COLUMNS), (sheet_name, first, last, last))
+            }
+            for card in remote_cards:
+                row = local.pop(card.idx, None)
+                remote_state = _state(card)
+                if row is None:
+                    if card.question is not None:
+                        self._insert(sheet_name, card, remote_state)
+                    continue
+                local_card = self._to_card(sheet_name, row[:10])
+                if card.question is None:
+                    card.question, card.answer, card.question_picture, \
+                        card.answer_picture = _content(local_card)
+                dirty, base = row[10], row[11]
+                state = remote_state
+                if dirty and self._local_wins(
+                        _state(local_card), remote_state, base):
+                    state = _state(local_card)
+                    card.first_practice, card.next_practice, card.streak, \
+                        card.interval, card.easiness = state
+                    to_push.append(card)
+                if state == _state(local_card) and \
+                        _content(card) == _content(local_card) and \
+                        base == json.dumps(remote_state):
+                    continue
+                self._conn.execute(
+                    'UPDATE cards SET question = ?, answer = ?, '
+                    'question_picture = ?, answer_picture = ?, '
+                    'first_practice = ?, next_practice = ?, streak = ?, '
+                    'interval = ?, easiness = ?, dirty = ?, base = ? '
+                    'WHERE sheet = ? AND idx = ?',
+                    _content(card) + state + [
+                        1 if state != remote_state else 0,
+                        json.dumps(remote_state), sheet_name, card.idx])
+            for idx in local:
+                self._conn.execute(
+                    'DELETE FROM cards WHERE sheet = ? AND idx = ?',
+                    (sheet_name, idx))
+            if last is None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO sheets (sheet, synced_at) '
+                    'VALUES (?, ?)', (sheet_name, synced_at))
+        return to_push
+
+    @staticmethod
+    def _local_wins(local_state, remote_state, base):
+        if base is None or json.loads(base) == remote_state:
+            return True
+        return local_state[1] > remote_state[1]
+
+    def _insert(self, sheet_name, card, state):
+        self._conn.execute(
+            'INSERT INTO cards (sheet, {}, dirty, base) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)'.format(_COLUMNS),
+            [sheet_name, card.idx] + _content(card) + state +
+            [json.dumps(state)])
+
+    @staticmethod
+    def _to_card(sheet_name, row):
+        card = Card(
+            idx=row[0], question=row[1], answer=row[2],
+            first_practice=row[5], next_practice=row[6],
+            streak=row[7], interval=row[8], easiness=row[9]
+        )
+        card.sheet = sheet_name
+        card.question_picture = row[3]
+        card.answer_picture = row[4]
+        return card
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from .card import parse_time
+
+logger = logging.getLogger(__name__)
+
+
+def sync_sheets(sheets, store, sheet_names, stop=None):
+    """Pulls the worksheets into the local store and pushes local reviews back.
+
+    The content of a row is only downloaded if it is due or not in the
+    store yet, the stored content of the others is kept. If stop() is true
+    once the worksheets are downloaded, the sync ends without touching the
+    store.
+    """
+    now = time.time()
+    known = dict(
+        (sheet_name, store.get_rows(sheet_name)) for sheet_name in sheet_names)
+
+    def needs_content(sheet_name, idx, schedule):
+        return idx not in known[sheet_name] or \
+            (parse_time(schedule[1]) or 0) < now
+
+    remote_cards = sheets.get_scheduled_cards(sheet_names, needs_content)
+    if stop is not None and stop():
+        logger.debug('Stopped syncing %s', ', '.join(sheet_names))
+        return
+    updates = []
+    for sheet_name in sheet_names:
+        to_push = store.merge(sheet_name, remote_cards[sheet_name], time.time())
+        updates.extend((sheet_name, card) for card in to_push)
+    if updates:
+        sheets.update_cards(updates)
+        store.mark_clean(updates)
+    logger.debug('Synced %s: %d rows, pushed %d',
+                 ', '.join(sheet_names),
+                 sum(len(cards) for cards in remote_cards.values()),
+                 len(updates))
+
+
+def stream_sheets(sheets, store, sheet_names, on_cards, stop=None):
+    """Pulls whole worksheets into the store block by block.
+
+    Every block of rows is merged as soon as it arrives and on_cards is
+    called with its cards, so a session can start long before a large
+    worksheet is downloaded. Local reviews are pushed back at the end.
+    stop() is checked before every block, once it is true the streaming
+    ends and the worksheet does not count as synced.
+    """
+    updates = []
+    for sheet_name in sheet_names:
+        synced_at = time.time()
+        end = 2
+        for first, last, cards in sheets.get_card_pages(sheet_name):
+            if stop is not None and stop():
+                logger.debug('Stopped streaming %s', sheet_name)
+                return
+            to_push = store.merge(
+                sheet_name, cards, synced_at, rows=(first, last))
+            updates.extend((sheet_name, card) for card in to_push)
+            on_cards(cards)
+            end = last + 1
+        # Drops stored rows past the end and marks the worksheet synced
+        store.merge(sheet_name, [], synced_at, rows=(end, None))
+    if updates:
+        sheets.update_cards(updates)
+        store.mark_clean(updates)
+    logger.debug('Streamed %s, pushed %d', ', '.join(sheet_names), len(updates))
@@ -0,0 +1,84 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+from . import files
+
+
+class Timings(object):
+    """Collects the durations of named spans and summarises them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+
+    @contextmanager
+    def span(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    def timed(self, name):
+        """Decorator that times every call of the function as a span."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def summary(self):
+        # type: () -> dict
+        """Returns the count and the p50/p90/p99/max milliseconds of each
+        span."""
+        with self._lock:
+            samples = dict(
+                (name, sorted(values)) for name, values in self._samples.items())
+        return dict(
+            (name, {
+                'count': len(values),
+                'p50': _percentile(values, 50),
+                'p90': _percentile(values, 90),
+                'p99': _percentile(values, 99),
+                'max': round(values[-1] * 1000, 1)
+            })
+            for name, values in samples.items()
+        )
+
+    def report(self, logger, path, keep=20):
+        """Logs the summary, adds it to the stats file and starts over."""
+        summary = self.summary()
+        with self._lock:
+            self._samples.clear()
+        if not summary:
+            return
+        for name, stats in sorted(summary.items()):
+            logger.info(
+                '%s: %d calls, p50 %.1f ms, p90 %.1f ms, p99 %.1f ms, '
+                'max %.1f ms', name, stats['count'], stats['p50'],
+                stats['p90'], stats['p99'], stats['max'])
+        try:
+            history = files.read_json(path) or []
+        except ValueError:
+            history = []
+        history.append({'time': time.time(), 'spans': summary})
+        files.write_json(path, history[-keep:])
+
+
+def _percentile(values, percent):
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return round(values[index] * 1000, 1)
+
+
+timings = Timings()
+span = timings.span
+timed = timings.timed
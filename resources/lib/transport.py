@@ -0,0 +1,85 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class _Counters(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def add(self, requests_=0, connections=0):
+        with self._lock:
+            self.requests += requests_
+            self.connections += connections
+
+
+def _counting_pool(pool_class, counters):
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            counters.add(connections=1)
+            return pool_class._new_conn(self)
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, counters, **kwargs):
+        self._counters = counters
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _counting_pool(pool_class, self._counters)
+            for scheme, pool_class
+            in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class Transport(object):
+    """One keep-alive HTTP session shared by the sheet, OAuth and pictures.
+
+    Connections are pooled per host, ``pool_connections`` hosts are kept and
+    at most ``pool_maxsize`` connections per host. ``timeout`` is used for
+    every request that does not set its own.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=4, timeout=30):
+        self.timeout = timeout
+        self._counters = _Counters()
+        self._session = requests.Session()
+        adapter = _CountingAdapter(
+            self._counters, pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        self._counters.add(requests_=1)
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    @property
+    def stats(self):
+        # type: () -> dict
+        requests_ = self._counters.requests
+        connections = self._counters.connections
+        return {
+            'requests': requests_,
+            'connections': connections,
+            'reused': max(0, requests_ - connections)
+        }
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,147 @@
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CardWriter(object):
+    """Collects reviewed cards and writes them back to the sheet in batches.
+
+    Repeated updates of the same row are merged, only the latest state is
+    sent. A batch goes out when ``batch_size`` rows are waiting or the oldest
+    pending row has waited ``interval`` seconds. ``close`` flushes whatever
+    is left. ``on_change`` is called whenever the number of pending rows
+    changes.
+
+    A batch that fails for a transient reason is sent again after
+    ``interval`` seconds. One the backend rejects for good is split up to
+    find the rows at fault, which are dropped, the others are written.
+    ``on_error`` is called at most once every ``error_interval`` seconds.
+    """
+
+    def __init__(self, sheets, interval=5.0, batch_size=50,
+                 on_error=None, on_change=None, on_written=None,
+                 error_interval=60.0):
+        self._sheets = sheets
+        self._interval = interval
+        self._batch_size = batch_size
+        self._on_error = on_error
+        self.on_change = on_change
+        self._on_written = on_written
+        self._error_interval = error_interval
+        self._error_at = None
+        self._pending = {}
+        self._in_flight = 0
+        self._oldest = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def put(self, sheet_name, card):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('CardWriter is closed')
+            self._pending[(sheet_name, card.idx)] = copy.copy(card)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._cond.notify()
+        self._changed()
+
+    def close(self, timeout=30):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    if self._closed and not self._pending:
+                        return
+                    self._cond.wait(self._wait_time())
+                batch = self._pending
+                self._pending = {}
+                self._oldest = None
+                self._in_flight = len(batch)
+            updates = [
+                (sheet_name, card)
+                for (sheet_name, _), card in sorted(batch.items())
+            ]
+            retry, error = self._write(updates)
+            with self._cond:
+                self._in_flight = 0
+                self._requeue(retry)
+            self._changed()
+            if error is not None:
+                self._report(error)
+            if retry:
+                if self._closed:
+                    return
+                with self._cond:
+                    self._cond.wait(self._interval)
+
+    def _ready(self):
+        if not self._pending:
+            return False
+        if self._closed or len(self._pending) >= self._batch_size:
+            return True
+        return time.time() - self._oldest >= self._interval
+
+    def _wait_time(self):
+        if self._oldest is None:
+            return None
+        return max(0, self._interval - (time.time() - self._oldest))
+
+    def _write(self, updates):
+        """Writes the (sheet_name, card) updates, returns the ones to send
+        again and the error, if any."""
+        try:
+            self._sheets.update_cards(updates)
+        except Exception as e:
+            if not getattr(e, 'permanent', False):
+                logger.warning('Could not write %d cards: %s', len(updates), e)
+                return updates, e
+            if len(updates) == 1:
+                logger.warning('Dropping the review of %s row %d: %s',
+                               updates[0][0], updates[0][1].idx, e)
+                return [], e
+            # Halves until the rejected rows are found
+            half = len(updates) // 2
+            retry, error = self._write(updates[:half])
+            if retry:
+                return retry + updates[half:], error
+            retry, second_error = self._write(updates[half:])
+            return retry, second_error or error
+        logger.debug('Wrote %d cards', len(updates))
+        if self._on_written is not None:
+            self._on_written(updates)
+        return [], None
+
+    def _requeue(self, updates):
+        for sheet_name, card in updates:
+            self._pending.setdefault((sheet_name, card.idx), card)
+        if self._pending and self._oldest is None:
+            self._oldest = time.time()
+
+    def _report(self, error):
+        now = time.time()
+        if self._on_error is None or self._error_at is not None and \
+                now - self._error_at < self._error_interval:
+            return
+        self._error_at = now
+        self._on_error(error)
+
+    def _changed(self):
+        on_change = self.on_change
+        if on_change is not None:
+            on_change()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from resources.lib import kodilogging
+from resources.lib import kodiservice
+
+import logging
+
+# Keep this file to a minimum, as Kodi
+# doesn't keep a compiled copy of this
+kodilogging.config()
+try:
+    kodiservice.SyncService().run()
+finally:
+    # Kodi does not run the atexit handlers, the queued records would be lost
+    logging.shutdown()
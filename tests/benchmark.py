@@ -0,0 +1,293 @@
+"""Headless benchmark of the addon against the FakeGoogle stand-in server.
+
+Runs every deck size in its own process, with the Kodi modules replaced by
+the stubs in kodi_stubs/ and a fresh profile directory, and measures:
+
+- get_cards_s: one two-phase fetch of the whole deck
+- card_update_us: Card.update, per card
+- download_pictures_s: prefetching 20 pictures
+- first_card_s / first_card_warm_s: MainWindow.onInit until the first
+  question is shown, with an empty and with a filled local store
+- transition_p50_s / transition_max_s: handling one select action during a
+  review session
+- peak_memory_mb: maximum resident set size of the run
+- http_*: requests per endpoint kind, connections opened
+
+The results are compared with benchmark_baseline.json, the exit status is 1
+if a metric regressed beyond its threshold. Run it with the Python of the
+Kodi version the addon targets (2.7), with requests and Pillow installed:
+
+    python2 tests/benchmark.py
+    python2 tests/benchmark.py --sizes 100,1000 --save-baseline
+
+Timings depend on the machine, record a baseline on yours before comparing.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+BASELINE_PATH = os.path.join(TESTS_DIR, 'benchmark_baseline.json')
+
+SIZES = [100, 1000, 10000, 100000]
+DECK = 'Deck'
+
+# Allowed growth over the baseline: (relative, absolute). Request counts get
+# a little slack, write batches and prefetching depend on timing.
+THRESHOLDS = [
+    ('http_', (0.2, 1.0)),
+    ('_s', (0.5, 0.05)),
+    ('_us', (0.5, 5.0)),
+    ('_mb', (0.25, 10.0)),
+]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def _join_threads():
+    # The background sync of a warm session
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+
+
+def run_one(size, options):
+    # type: (int, argparse.Namespace) -> dict
+    """Measures one deck size, in a process of its own."""
+    sys.path[:0] = [os.path.join(TESTS_DIR, 'kodi_stubs'), TESTS_DIR, ROOT_DIR]
+    logging.basicConfig(level=logging.WARNING)
+    import xbmcaddon
+    import xbmcgui
+    from fake_google import FakeGoogle, SHEET_ID, synthetic_deck
+    from resources.lib import DATA_DIR
+    from resources.lib import files
+    from resources.lib import pictures
+    from resources.lib import prefetch
+    from resources.lib import script
+
+    xbmcaddon.SETTINGS.update({
+        'prefetch_ahead': 5,
+        'prefetch_workers': 3,
+        'reviews_per_new': 4,
+    })
+    results = {}
+
+    google = FakeGoogle(
+        connect_latency=options.connect_latency,
+        request_latency=options.latency,
+        picture_latency=options.picture_latency).start()
+    google.add_deck(DECK, synthetic_deck(size, seed=options.seed))
+    google.patch()
+
+    def record_calls(prefix):
+        for kind, count in google.calls.items():
+            results['http_{}_{}'.format(prefix, kind)] = count
+        results['http_{}_connections'.format(prefix)] = google.connections
+        google.reset()
+
+    # Every context is a launch of the addon
+    context = script.Context('client-id', 'client-secret', SHEET_ID)
+    files.write_json(os.path.join(DATA_DIR, 'creds.json'), {
+        'access_token': 'fake-access-token',
+        'expires_at': int(time.time()) + 3600,
+        'refresh_token': 'fake-refresh-token'
+    })
+
+    # get_cards
+    google.reset()
+    start = time.time()
+    cards = context.sheet.get_scheduled_cards(
+        [DECK], lambda *args: True)[DECK]
+    results['get_cards_s'] = time.time() - start
+    record_calls('get_cards')
+
+    # Card.update
+    start = time.time()
+    for i, each in enumerate(cards):
+        each.update(i % 6)
+    results['card_update_us'] = (time.time() - start) / len(cards) * 1e6
+
+    # download_pictures
+    urls = [
+        each.question_picture for each in cards if each.question_picture][:20]
+    prefetcher = prefetch.PicturePrefetcher(
+        lambda url: pictures.download_picture(context.transport, url))
+    start = time.time()
+    prefetcher.request(urls, 0)
+    for url in urls:
+        prefetcher.wait(url)
+    results['download_pictures_s'] = time.time() - start
+    prefetcher.close()
+    context.close()
+    record_calls('download_pictures')
+
+    # Review sessions, with an empty and with a filled store
+    select = xbmcgui.Action(xbmcgui.ACTION_SELECT_ITEM)
+    transitions = []
+    for session in ('cold', 'warm'):
+        context = script.Context('client-id', 'client-secret', SHEET_ID)
+        window = script.MainWindow(
+            'main-window.xml', ROOT_DIR, 'default', '1080i', False,
+            context=context, sheet_names=[DECK])
+        start = time.time()
+        window.onInit()
+        results['first_card_s' if session == 'cold' else
+                'first_card_warm_s'] = time.time() - start
+        for _ in range(options.reviews):
+            if window.idx >= len(window.cards):
+                break
+            for _ in range(2):  # show the answer, score and go to the next
+                start = time.time()
+                window.onAction(select)
+                transitions.append(time.time() - start)
+        window.stop_render_ahead()
+        window.prefetcher.close()
+        window.writer.on_change = None
+        _join_threads()
+        context.close()
+        record_calls(session)
+    results['transition_p50_s'] = _percentile(transitions, 50)
+    results['transition_max_s'] = _percentile(transitions, 100)
+
+    google.stop()
+    results['peak_memory_mb'] = _peak_memory_mb()
+    return results
+
+
+def run(size, options):
+    """Runs run_one in a child process with a fresh profile directory."""
+    profile = tempfile.mkdtemp(prefix='benchmark-profile-')
+    env = dict(os.environ, KODI_PROFILE=profile)
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-one', str(size),
+        '--reviews', str(options.reviews),
+        '--latency', str(options.latency),
+        '--connect-latency', str(options.connect_latency),
+        '--picture-latency', str(options.picture_latency),
+        '--seed', str(options.seed),
+    ]
+    try:
+        output = subprocess.check_output(command, env=env)
+    finally:
+        shutil.rmtree(profile, ignore_errors=True)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def _threshold(metric):
+    for affix, threshold in THRESHOLDS:
+        if metric.startswith(affix) or metric.endswith(affix):
+            return threshold
+    return None
+
+
+def compare(results, baseline):
+    """Returns a line per metric that grew beyond its threshold."""
+    regressions = []
+    for size, metrics in sorted(results.items(), key=lambda item: int(item[0])):
+        base_metrics = baseline.get(size)
+        if base_metrics is None:
+            continue
+        for metric, value in sorted(metrics.items()):
+            threshold = _threshold(metric)
+            if threshold is None:
+                continue
+            base = base_metrics.get(metric, 0)
+            relative, absolute = threshold
+            limit = base * (1 + relative) + absolute
+            if value > limit:
+                regressions.append('{} rows, {}: {:.4g} > {:.4g} (baseline {:.4g})'.format(
+                    size, metric, value, limit, base))
+    return regressions
+
+
+def _print_results(results):
+    metrics = sorted(set(
+        metric for values in results.values() for metric in values))
+    sizes = sorted(results, key=int)
+    print('{:<36}'.format('rows') + ''.join('{:>12}'.format(size) for size in sizes))
+    for metric in metrics:
+        print('{:<36}'.format(metric) + ''.join(
+            '{:>12.4g}'.format(results[size].get(metric, 0)) for size in sizes))
+
+
+def _options(options):
+    return dict(
+        reviews=options.reviews, latency=options.latency,
+        connect_latency=options.connect_latency,
+        picture_latency=options.picture_latency, seed=options.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='comma separated deck sizes')
+    parser.add_argument('--reviews', type=int, default=50,
+                        help='cards reviewed per session')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every request')
+    parser.add_argument('--connect-latency', type=float, default=0.05,
+                        help='seconds added to every new connection')
+    parser.add_argument('--picture-latency', type=float, default=0.1,
+                        help='seconds added to every picture download')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.run_one is not None:
+        print(json.dumps(run_one(options.run_one, options)))
+        return 0
+
+    results = {}
+    for size in [int(size) for size in options.sizes.split(',')]:
+        sys.stderr.write('Benchmarking {} rows\n'.format(size))
+        results[str(size)] = run(size, options)
+    _print_results(results)
+
+    if options.save_baseline:
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump({'options': _options(options), 'results': results},
+                      baseline_file, indent=2, separators=(',', ': '),
+                      sort_keys=True)
+            baseline_file.write('\n')
+        return 0
+    if not os.path.exists(BASELINE_PATH):
+        return 0
+    with open(BASELINE_PATH) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['options'] != _options(options):
+        sys.stderr.write('The baseline was recorded with {}, not compared\n'.format(
+            baseline['options']))
+        return 0
+    regressions = compare(results, baseline['results'])
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""Puts the Kodi stubs, the test helpers and the addon on the path."""
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[:0] = [
+    os.path.join(TESTS_DIR, 'kodi_stubs'), TESTS_DIR, os.path.dirname(TESTS_DIR)]
@@ -0,0 +1,223 @@
+"""Stand-in for the Google endpoints the addon uses, backed by in-memory decks.
+
+Serves the OAuth token endpoint, the Sheets spreadsheet metadata, values
+reads (single range and batchGet) and writes (PUT and batchUpdate), and
+pictures under /img/, with an ETag. Writes are applied to the decks, so a later read sees
+them. Requests are counted per kind in ``calls``.
+
+    with FakeGoogle(request_latency=0.1) as google:
+        google.add_deck('Words', synthetic_deck(1000))
+        google.patch()  # point GoogleSheets and TokenManager at the server
+"""
+from datetime import datetime
+import hashlib
+import io
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+
+try:
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+except ImportError:
+    from urllib.parse import urlparse, parse_qs, unquote
+
+from stand_in_server import StandInServer
+
+SHEET_ID = 'fake-sheet'
+
+_A1 = re.compile(r'^(.+)!([A-Z])(\d+)(?::([A-Z])(\d*))?$')
+_DAY = 86400
+
+
+def synthetic_deck(size, new=0.3, pictures=0.1, seed=0):
+    # type: (int, float, float, int) -> list
+    """Returns size sheet rows (columns A-I) with the given share of never
+    practised cards and of cards with a question picture.
+
+    The practised cards are due from 10 days ago to 30 days from now.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    rows = []
+    for i in range(size):
+        if rng.random() < new:
+            row = ['', '', '', '', '']
+        else:
+            first = now - rng.uniform(10, 400) * _DAY
+            due = now + rng.uniform(-10, 30) * _DAY
+            row = [
+                datetime.fromtimestamp(first).isoformat(),
+                datetime.fromtimestamp(due).isoformat(),
+                rng.randint(1, 8),
+                round(rng.uniform(1, 60), 2),
+                round(rng.uniform(1.3, 2.8), 2)
+            ]
+        row += ['Question {}'.format(i), 'Answer {}'.format(i)]
+        if rng.random() < pictures:
+            row.append('/img/{}.png'.format(i))
+        rows.append(row)
+    return rows
+
+
+def _picture(width=1600, height=1000):
+    try:
+        from PIL import Image
+    except ImportError:
+        return b''
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (
+        gradient,
+        gradient.transpose(Image.FLIP_TOP_BOTTOM),
+        gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+def _with_text(png, text):
+    """Adds a tEXt chunk after the IHDR chunk of the PNG."""
+    data = b'Comment\0' + text.encode('utf-8')
+    chunk = b'tEXt' + data
+    chunk = struct.pack('>I', len(data)) + chunk + \
+        struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+    # 8 bytes of signature, then IHDR: length, type, 13 bytes, CRC
+    return png[:33] + chunk + png[33:]
+
+
+class FakeGoogle(StandInServer):
+
+    def __init__(self, connect_latency=0.0, request_latency=0.0,
+                 picture_latency=0.0):
+        StandInServer.__init__(self, connect_latency, request_latency)
+        self.picture_latency = picture_latency
+        self.decks = {}
+        self.calls = {}
+        self._picture = None
+        self._decks_lock = threading.Lock()
+
+    def add_deck(self, name, rows):
+        """Adds a worksheet, picture paths (/img/...) are made absolute."""
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for col in (7, 8):
+                if len(row) > col and row[col].startswith('/'):
+                    row[col] = self.url + row[col]
+        with self._decks_lock:
+            self.decks[name] = rows
+
+    def patch(self):
+        """Points the addon's Google endpoints at this server."""
+        from resources.lib import auth
+        from resources.lib import sheet
+        sheet.GoogleSheets._BASE_URL = self.url + '/v4/spreadsheets'
+        auth.TokenManager._TOKEN_URL = self.url + '/token'
+        auth.TokenManager._DEVICE_CODE_URL = self.url + '/device/code'
+
+    def reset(self):
+        StandInServer.reset(self)
+        with self._lock:
+            self.calls = {}
+
+    def route(self, method, path, headers, body):
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        parts = url.path.split('/')
+        if url.path == '/token':
+            return self._reply('token', {
+                'access_token': 'fake-access-token',
+                'expires_in': 3600
+            })
+        if url.path == '/device/code':
+            return self._reply('device_code', {
+                'device_code': 'fake-device-code',
+                'user_code': 'FAKE-CODE',
+                'verification_url': self.url + '/device',
+                'expires_in': 1800,
+                'interval': 1
+            })
+        if url.path.startswith('/img/'):
+            time.sleep(self.picture_latency)
+            with self._decks_lock:
+                if self._picture is None:
+                    self._picture = _picture()
+            # The same pixels, but different bytes for every path
+            content = _with_text(self._picture, url.path)
+            etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+            if headers.get('If-None-Match') == etag:
+                self._count_call('picture_not_modified')
+                return 304, 'image/png', b'', {'ETag': etag}
+            self._count_call('picture')
+            return 200, 'image/png', content, {'ETag': etag}
+        if url.path == '/v4/spreadsheets/{}'.format(SHEET_ID):
+            with self._decks_lock:
+                titles = sorted(self.decks)
+            return self._reply('spreadsheet', {'sheets': [
+                {'properties': {'title': title}} for title in titles
+            ]})
+        if url.path.endswith('/values:batchGet'):
+            return self._reply('batch_get', {'valueRanges': [
+                {'range': a1_range, 'values': self._read(a1_range)}
+                for a1_range in query.get('ranges', [])
+            ]})
+        if url.path.endswith('/values:batchUpdate'):
+            content = json.loads(body.decode('utf-8'))
+            for data in content['data']:
+                self._write(data['range'], data['values'])
+            return self._reply('batch_update', {})
+        if len(parts) == 6 and parts[4] == 'values':
+            a1_range = unquote(parts[5])
+            if method == 'PUT':
+                self._write(a1_range, json.loads(body.decode('utf-8'))['values'])
+                return self._reply('update', {})
+            return self._reply('get', {
+                'range': a1_range, 'values': self._read(a1_range)})
+        self._count_call('unknown')
+        return 404, 'application/json', b'{}'
+
+    def _reply(self, kind, content):
+        self._count_call(kind)
+        return 200, 'application/json', json.dumps(content).encode('utf-8')
+
+    def _count_call(self, kind):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def _parse(self, a1_range):
+        match = _A1.match(a1_range)
+        if match is None:
+            raise ValueError(a1_range)
+        name, first_col, first_row, last_col, last_row = match.groups()
+        last_col = last_col or first_col
+        if match.group(4) is None:
+            last_row = first_row
+        return (name, ord(first_col) - ord('A'), ord(last_col) - ord('A') + 1,
+                int(first_row), int(last_row) if last_row else None)
+
+    def _read(self, a1_range):
+        name, first_col, last_col, first_row, last_row = self._parse(a1_range)
+        with self._decks_lock:
+            rows = self.decks.get(name, [])
+            end = len(rows) if last_row is None else last_row - 1
+            values = [
+                list(row[first_col:last_col]) for row in rows[first_row - 2:end]]
+        # Like the API, trailing empty cells and rows are left out
+        for row in values:
+            while row and row[-1] in ('', None):
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, a1_range, values):
+        name, first_col, _, first_row, _ = self._parse(a1_range)
+        with self._decks_lock:
+            rows = self.decks[name]
+            for i, new_values in enumerate(values):
+                row = rows[first_row - 2 + i]
+                row.extend([''] * (first_col + len(new_values) - len(row)))
+                row[first_col:first_col + len(new_values)] = new_values
@@ -0,0 +1,68 @@
+"""Minimal stand-in for Kodi's xbmc module, enough to run the addon headless.
+
+The profile directory is taken from the KODI_PROFILE environment variable.
+"""
+import os
+import tempfile
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+LOGSEVERE = 5
+LOGFATAL = 6
+LOGNONE = 7
+
+PROFILE_DIR = os.environ.get('KODI_PROFILE') or tempfile.mkdtemp()
+if not os.path.exists(os.path.join(PROFILE_DIR, 'addon_data')):
+    os.makedirs(os.path.join(PROFILE_DIR, 'addon_data'))
+
+log_records = []
+builtins = []
+
+
+def log(msg, level=LOGDEBUG):
+    log_records.append((level, msg))
+
+
+def translatePath(path):
+    if path.startswith('special://profile/'):
+        path = os.path.join(PROFILE_DIR, path[len('special://profile/'):])
+    return path
+
+
+def executebuiltin(function, wait=False):
+    builtins.append(function)
+
+
+def executeJSONRPC(request):
+    return '{}'
+
+
+def sleep(milliseconds):
+    pass
+
+
+# What getGlobalIdleTime returns
+IDLE_TIME = 0
+
+
+def getGlobalIdleTime():
+    return IDLE_TIME
+
+
+class Player(object):
+    def isPlaying(self):
+        return False
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        return False
+
+    def onSettingsChanged(self):
+        pass
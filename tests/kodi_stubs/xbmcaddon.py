@@ -0,0 +1,34 @@
+"""Minimal stand-in for Kodi's xbmcaddon module.
+
+Settings come from the module level SETTINGS dict. Like Kodi on Python 2,
+getSetting and getAddonInfo return UTF-8 encoded strings.
+"""
+
+SETTINGS = {}
+
+INFO = {
+    'id': 'script.remember.everything',
+    'name': 'Remember Everything!',
+    'path': '.',
+    'icon': 'resources/icon.png',
+}
+
+
+class Addon(object):
+    def __init__(self, id=None):
+        pass
+
+    def getSetting(self, key):
+        return u'{}'.format(SETTINGS.get(key, u'')).encode('utf-8')
+
+    def setSetting(self, key, value):
+        SETTINGS[key] = value
+
+    def getAddonInfo(self, key):
+        return INFO.get(key, u'').encode('utf-8')
+
+    def getLocalizedString(self, string_id):
+        return u'#{}'.format(string_id)
+
+    def openSettings(self):
+        pass
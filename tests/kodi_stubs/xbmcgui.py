@@ -0,0 +1,195 @@
+"""Minimal stand-in for Kodi's xbmcgui module.
+
+Windows hand out a Control for any id, controls keep what was set on them.
+Nothing is drawn, doModal returns at once.
+"""
+
+ACTION_MOVE_LEFT = 1
+ACTION_MOVE_RIGHT = 2
+ACTION_MOVE_UP = 3
+ACTION_MOVE_DOWN = 4
+ACTION_SELECT_ITEM = 7
+ACTION_PREVIOUS_MENU = 10
+ACTION_NAV_BACK = 92
+
+
+class Action(object):
+    def __init__(self, action_id):
+        self._id = action_id
+
+    def getId(self):
+        return self._id
+
+
+class Control(object):
+    def __init__(self, control_id):
+        self.id = control_id
+        self.label = None
+        self.image = None
+        self.visible = True
+        self.position = (0, 0)
+        self.width = 0
+        self.height = 0
+
+    def getId(self):
+        return self.id
+
+    def setLabel(self, label):
+        self.label = label
+
+    def getLabel(self):
+        return self.label
+
+    def setImage(self, image, useCache=True):
+        self.image = image
+
+    def setVisible(self, visible):
+        self.visible = visible
+
+    def setPosition(self, x, y):
+        self.position = (x, y)
+
+    def setWidth(self, width):
+        self.width = width
+
+    def setHeight(self, height):
+        self.height = height
+
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path=''):
+        self.label = label
+        self.label2 = label2
+        self.properties = {}
+
+    def getLabel(self):
+        return self.label
+
+    def setLabel(self, label):
+        self.label = label
+
+    def setLabel2(self, label):
+        self.label2 = label
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+
+class Window(object):
+    # Like Kodi, the window is set up in __new__, subclasses need not call
+    # __init__
+    def __new__(cls, *args, **kwargs):
+        window = object.__new__(cls)
+        window._controls = {}
+        window._items = []
+        window._position = 0
+        window._focus = None
+        window._window_id = args[0] if args else None
+        return window
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def getControl(self, control_id):
+        if control_id not in self._controls:
+            self._controls[control_id] = Control(control_id)
+        return self._controls[control_id]
+
+    def setProperty(self, key, value):
+        PROPERTIES.setdefault(self._window_id, {})[key] = value
+
+    def getProperty(self, key):
+        return PROPERTIES.get(self._window_id, {}).get(key, '')
+
+    def clearProperty(self, key):
+        PROPERTIES.get(self._window_id, {}).pop(key, None)
+
+    def doModal(self):
+        self.onInit()
+
+    def show(self):
+        self.onInit()
+
+    def close(self):
+        pass
+
+    def onInit(self):
+        pass
+
+    def onAction(self, action):
+        pass
+
+    def setFocusId(self, control_id):
+        self._focus = control_id
+
+    def getFocusId(self):
+        return self._focus
+
+    def addItems(self, items):
+        self._items.extend(items)
+
+    def clearList(self):
+        self._items = []
+
+    def getListSize(self):
+        return len(self._items)
+
+    def getListItem(self, position):
+        return self._items[position]
+
+    def getCurrentListPosition(self):
+        return self._position
+
+    def setCurrentListPosition(self, position):
+        self._position = position
+
+    def getCurrentContainerId(self):
+        return 50
+
+
+class WindowXML(Window):
+    pass
+
+
+class WindowXMLDialog(WindowXML):
+    pass
+
+
+# Window properties by window id, shared by the Window objects like in Kodi
+PROPERTIES = {}
+
+# What Dialog().browse returns
+BROWSE_RESULT = ''
+
+
+class Dialog(object):
+    def ok(self, heading, *lines):
+        return True
+
+    def yesno(self, heading, *lines, **kwargs):
+        return True
+
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        pass
+
+    def browse(self, type, heading, shares, mask='', *args, **kwargs):
+        return BROWSE_RESULT
+
+
+class DialogProgress(object):
+    def create(self, heading, *lines):
+        self.percent = 0
+        self.lines = lines
+
+    def update(self, percent, *lines):
+        self.percent = percent
+        self.lines = lines
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
@@ -0,0 +1,123 @@
+"""Local HTTP/1.1 stand-in for the remote endpoints the addon talks to.
+
+Every new TCP connection is delayed by ``connect_latency`` seconds to model
+the TCP+TLS handshake, every request by ``request_latency``. The server
+counts both, so a test can compare how many round trips a client saves by
+reusing connections:
+
+    with StandInServer(connect_latency=0.05) as server:
+        transport.get(server.url + '/anything')
+        server.connections, server.requests
+"""
+import json
+import socket
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        self.server.stand_in.count(connections=1)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        time.sleep(self.server.stand_in.connect_latency)
+        BaseHTTPRequestHandler.handle(self)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def do_PUT(self):
+        self._respond()
+
+    def _respond(self):
+        stand_in = self.server.stand_in
+        stand_in.count(requests=1)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        time.sleep(stand_in.request_latency)
+        response = stand_in.route(self.command, self.path, self.headers, body)
+        status, content_type, content = response[:3]
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (response[3] if len(response) > 3 else {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(object):
+    """Serves ``{}`` for every path unless ``route`` is overridden.
+
+    ``route`` returns (status, content type, body) and optionally a dict of
+    extra response headers.
+    """
+
+    def __init__(self, connect_latency=0.0, request_latency=0.0):
+        self.connect_latency = connect_latency
+        self.request_latency = request_latency
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stand_in = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def count(self, connections=0, requests=0):
+        with self._lock:
+            self.connections += connections
+            self.requests += requests
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+
+    def route(self, method, path, headers, body):
+        return 200, 'application/json', json.dumps({}).encode('utf-8')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def measure(get, url, count):
+    """Returns the seconds ``count`` calls of ``get(url)`` take."""
+    start = time.time()
+    for _ in range(count):
+        get(url).close()
+    return time.time() - start
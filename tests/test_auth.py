@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from resources.lib import auth
+from resources.lib import files
+
+
+class Response(object):
+
+    def __init__(self, content):
+        self.ok = True
+        self._content = content
+
+    def json(self):
+        return self._content
+
+
+class TokenEndpoint(object):
+    """Stands in for the transport, answers token refreshes."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return Response({'access_token': 'new-token', 'expires_in': 3600})
+
+
+def _tokens(tmpdir, transport, expires_at):
+    path = str(tmpdir.join('creds.json'))
+    files.write_json(path, {
+        'access_token': 'old-token',
+        'expires_at': expires_at,
+        'refresh_token': 'refresh-token'
+    })
+    return auth.TokenManager('id', 'secret', path, transport)
+
+
+def _in_thread(func):
+    """Runs func in a thread, returns a dict with its result or error."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = func()
+        except Exception as e:  # pylint:disable=broad-except
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread, outcome
+
+
+def test_valid_token_needs_no_request(tmpdir):
+    transport = TokenEndpoint()
+    tokens = _tokens(tmpdir, transport, time.time() + 3600)
+    assert tokens.token == 'old-token'
+    assert transport.calls == 0
+    tokens.close()
+
+
+def test_concurrent_callers_share_one_refresh(tmpdir):
+    transport = TokenEndpoint(delay=0.2)
+    tokens = _tokens(tmpdir, transport, time.time() - 1)
+    runs = [_in_thread(lambda: tokens.token) for _ in range(5)]
+    for thread, _ in runs:
+        thread.join(5)
+    assert [outcome.get('result') for _, outcome in runs] == ['new-token'] * 5
+    assert transport.calls == 1
+    tokens.close()
+
+
+def test_failed_refresh_does_not_block_later_callers(tmpdir):
+    transport = TokenEndpoint(error=IOError('connection refused'))
+    tokens = _tokens(tmpdir, transport, time.time() - 1)
+    with pytest.raises(IOError):
+        tokens.token
+    transport.error = None
+    thread, outcome = _in_thread(lambda: tokens.token)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert outcome == {'result': 'new-token'}
+    tokens.close()
+
+
+def test_login_is_needed_without_credentials(tmpdir):
+    with pytest.raises(auth.AuthError):
+        auth.TokenManager(
+            'id', 'secret', str(tmpdir.join('creds.json')), TokenEndpoint())
@@ -0,0 +1,52 @@
+from datetime import datetime
+import time
+
+import pytest
+
+from resources.lib import card
+from resources.lib.card import Card
+
+
+def test_parse_time_reads_the_sheet_format():
+    epoch = time.mktime(datetime(2024, 3, 5, 14, 30, 15).timetuple()) + 0.25
+    assert card.parse_time('2024-03-05T14:30:15.250000') == epoch
+    assert card.parse_time('2024-03-05') == epoch - 14 * 3600 - 30 * 60 - 15.25
+
+
+def test_format_time_round_trips():
+    epoch = time.mktime(datetime(2023, 11, 20, 8, 5).timetuple()) + 7.5
+    assert card.parse_time(card.format_time(epoch)) == epoch
+    assert card.format_time(None) == ''
+
+
+def test_parse_time_of_numbers_and_blanks():
+    assert card.parse_time(1700000000) == 1700000000.0
+    assert card.parse_time('') is None
+    assert card.parse_time(None) is None
+    assert card.parse_time('not a date') is None
+
+
+def test_new_card_defaults():
+    new = Card(2, 'q', 'a', '', '', '', '', '')
+    assert new.first_practice is None
+    assert new.next_practice == 0.0
+    assert (new.streak, new.interval, new.easiness) == (0, 1, 2.5)
+
+
+def test_stored_zero_interval_is_kept():
+    lapsed = Card(2, 'q', 'a', 1.0, 2.0, 0, 0, 1.3)
+    assert lapsed.interval == 0
+
+
+def test_update_and_relearned():
+    reviewed = Card(2, 'q', 'a', None, 0, None, None, None)
+    before = time.time()
+    reviewed.update(5)
+    assert reviewed.first_practice >= before
+    assert (reviewed.streak, reviewed.interval) == (1, 1)
+    assert reviewed.next_practice - reviewed.first_practice == \
+        pytest.approx(86400, abs=1)
+    reviewed.update(1)
+    assert (reviewed.streak, reviewed.interval) == (0, 0)
+    reviewed.relearned()
+    assert (reviewed.streak, reviewed.interval) == (1, 1)
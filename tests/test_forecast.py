@@ -0,0 +1,64 @@
+import pytest
+
+from resources.lib import card as card_module
+from resources.lib import forecast
+from resources.lib.card import Card
+
+np = pytest.importorskip('numpy')
+
+NOW = 1700000000.0
+DAY = 86400.0
+
+
+def _cards():
+    cards = []
+    for streak, interval, easiness in [
+            (None, None, None), (0, 0, 1.3), (1, 1, 2.5), (2, 4, 2.2),
+            (5, 37.5, 2.8), (8, 120.0, 1.4)]:
+        cards.append(Card(
+            len(cards) + 2, 'q', 'a', NOW - 100 * DAY if streak else None,
+            NOW - DAY if streak is not None else 0, streak, interval,
+            easiness))
+    return cards
+
+
+@pytest.mark.parametrize('score', range(6))
+def test_kernel_matches_card_update(monkeypatch, score):
+    cards = _cards()
+    deck = forecast.DeckArrays.from_states([
+        (card.next_practice, card.streak, card.interval, card.easiness)
+        for card in cards], NOW)
+    monkeypatch.setattr(card_module.time, 'time', lambda: NOW)
+    for card in cards:
+        card.update(score)
+    deck.update(np.ones(len(cards), dtype=bool), score, 0.0)
+
+    assert deck.streak.tolist() == [card.streak for card in cards]
+    assert deck.interval == pytest.approx([card.interval for card in cards])
+    assert deck.easiness == pytest.approx([card.easiness for card in cards])
+    assert deck.due == pytest.approx(
+        [(card.next_practice - NOW) / DAY for card in cards])
+
+
+def test_update_leaves_cards_outside_the_mask():
+    deck = forecast.DeckArrays.from_states(
+        [(NOW, 3, 10.0, 2.5), (NOW, 3, 10.0, 2.5)], NOW)
+    deck.update(np.array([True, False]), 5, 0.0)
+    assert deck.streak.tolist() == [4, 3]
+    assert deck.interval[1] == 10.0
+
+
+def test_forecast_counts_due_cards():
+    # All remembered: the new card comes back after 1 and 4 days, the
+    # reviewed one in 25
+    deck = forecast.DeckArrays.from_states([
+        (NOW - DAY, 3, 10.0, 2.5), (0, None, None, None),
+        (NOW + 9.5 * DAY, 3, 10.0, 2.5)], NOW)
+    due = forecast.forecast(deck, days=12, runs=3, recall=1.0, seed=1)
+    assert due == [2, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0]
+
+
+def test_forgotten_cards_come_back_the_next_day():
+    deck = forecast.DeckArrays.from_states([(NOW, 3, 10.0, 2.5)], NOW)
+    due = forecast.forecast(deck, days=5, runs=2, recall=0.0, seed=1)
+    assert due == [1] * 5
@@ -0,0 +1,45 @@
+import logging
+
+import pytest
+import xbmc
+import xbmcaddon
+
+from resources.lib import kodilogging
+
+
+@pytest.fixture
+def log():
+    xbmcaddon.SETTINGS['debug'] = 'true'
+    del xbmc.log_records[:]
+    handler = kodilogging.KodiLogHandler()
+    logger = logging.getLogger('test_kodilogging')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    yield logger, handler
+    logger.removeHandler(handler)
+    handler.close()
+    xbmcaddon.SETTINGS.pop('debug')
+
+
+def test_records_are_written_on_close(log):
+    logger, handler = log
+    for i in range(100):
+        logger.info('record %d', i)
+    logger.error('failed')
+    handler.close()
+    assert len(xbmc.log_records) == 101
+    assert xbmc.log_records[0] == (
+        xbmc.LOGINFO, '[script.remember.everything] test_kodilogging: record 0')
+    assert xbmc.log_records[-1][0] == xbmc.LOGERROR
+
+
+def test_debug_setting_is_read_again_when_settings_change(log):
+    logger, handler = log
+    xbmcaddon.SETTINGS['debug'] = 'false'
+    logger.info('kept')
+    handler._monitor.onSettingsChanged()
+    logger.info('dropped')
+    handler.close()
+    assert [message for _, message in xbmc.log_records] == \
+        ['[script.remember.everything] test_kodilogging: kept']
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import io
+import sqlite3
+import zipfile
+
+import pytest
+
+from resources.lib import backend
+from resources.lib import localdeck
+
+
+def _write(tmpdir, name, text, encoding='utf-8'):
+    path = tmpdir.join(name)
+    with io.open(str(path), 'w', encoding=encoding, newline='') as out:
+        out.write(text)
+    return str(path)
+
+
+def _apkg(tmpdir, notes, names=('collection.anki2',)):
+    collection = str(tmpdir.join('collection'))
+    conn = sqlite3.connect(collection)
+    conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, flds TEXT)')
+    conn.executemany(
+        'INSERT INTO notes (id, flds) VALUES (?, ?)', enumerate(notes, 1))
+    conn.commit()
+    conn.close()
+    path = str(tmpdir.join('deck.apkg'))
+    package = zipfile.ZipFile(path, 'w')
+    for name in names:
+        package.write(collection, name)
+    package.close()
+    return path
+
+
+def test_read_csv_with_header_and_pictures(tmpdir):
+    path = _write(tmpdir, 'deck.csv', u'﻿question,answer,question picture\r\n'
+                  u'Bonjour,Hello,http://img/1.png\r\n'
+                  u'Ça va?,"How are you, fine?"\r\n'
+                  u'lonely\r\n')
+    assert localdeck.read_csv(path) == [
+        (u'Bonjour', u'Hello', u'http://img/1.png', None),
+        (u'Ça va?', u'How are you, fine?', None, None),
+    ]
+
+
+@pytest.mark.parametrize('delimiter', [';', '\t'])
+def test_read_csv_sniffs_the_delimiter(tmpdir, delimiter):
+    path = _write(tmpdir, 'deck.csv', u'one{0}1\ntwo{0}2\n'.format(delimiter))
+    assert localdeck.read_csv(path) == [
+        (u'one', u'1', None, None), (u'two', u'2', None, None)]
+
+
+def test_read_csv_that_is_not_utf8(tmpdir):
+    path = _write(tmpdir, 'deck.csv', u'Ça,va\n', encoding='latin-1')
+    with pytest.raises(backend.DeckError):
+        localdeck.read_csv(path)
+
+
+def test_read_apkg_drops_formatting(tmpdir):
+    path = _apkg(tmpdir, [
+        u'<b>Bonjour</b>\x1fHello<br>there &amp; here',
+        u'[sound:a.mp3]Merci\x1f<div>Thanks</div>',
+        u'no answer',
+    ])
+    assert localdeck.read_deck(path) == [
+        (u'Bonjour', u'Hello\nthere & here', None, None),
+        (u'Merci', u'Thanks', None, None),
+    ]
+
+
+def test_read_apkg_of_a_new_anki_version(tmpdir):
+    path = _apkg(tmpdir, [u'q\x1fa'],
+                 names=('collection.anki2', 'collection.anki21b'))
+    with pytest.raises(backend.DeckError):
+        localdeck.read_apkg(path)
+
+
+def test_read_apkg_that_is_no_package(tmpdir):
+    path = _write(tmpdir, 'deck.apkg', u'not a zip')
+    with pytest.raises(backend.DeckError):
+        localdeck.read_apkg(path)
+
+
+def _decks(tmpdir):
+    return localdeck.LocalDecks(str(tmpdir.join('decks.db')))
+
+
+def test_import_deck(tmpdir):
+    decks = _decks(tmpdir)
+    progress = []
+    rows = [(u'q{}'.format(i), u'a', None, None) for i in range(7)]
+    localdeck._BLOCK_ROWS, block_rows = 3, localdeck._BLOCK_ROWS
+    try:
+        assert decks.import_deck(
+            u'Words', rows, lambda done, total: progress.append(done)) == 7
+        cards = list(decks.get_cards(u'Words'))
+        pages = list(decks.get_card_pages(u'Words'))
+    finally:
+        localdeck._BLOCK_ROWS = block_rows
+    assert progress == [3, 6, 7]
+    assert decks.get_sheet_names() == [u'Words']
+    assert [card.idx for card in cards] == list(range(2, 9))
+    assert [(first, last) for first, last, _ in pages] == \
+        [(2, 4), (5, 7), (8, 8)]
+    assert cards[0].sheet == u'Words'
+    assert cards[0].next_practice == 0.0
+
+
+def test_reimport_keeps_the_review_state(tmpdir):
+    decks = _decks(tmpdir)
+    decks.import_deck(u'Words', [(u'kept', u'a', None, None),
+                                 (u'gone', u'a', None, None)])
+    cards = list(decks.get_cards(u'Words'))
+    for card in cards:
+        card.update(5)
+    decks.update_cards([(u'Words', card) for card in cards])
+
+    decks.import_deck(u'Words', [(u'new', u'a', None, None),
+                                 (u'kept', u'changed', None, None)])
+    new, kept = decks.get_cards(u'Words')
+    assert (new.idx, new.question, new.streak) == (2, u'new', 0)
+    assert (kept.idx, kept.answer, kept.streak) == (3, u'changed', 1)
+    assert kept.next_practice == cards[0].next_practice
+
+
+def test_remove_deck(tmpdir):
+    decks = _decks(tmpdir)
+    decks.import_deck(u'Words', [(u'q', u'a', None, None)])
+    decks.remove_deck(u'Words')
+    assert decks.get_sheet_names() == []
+    assert list(decks.get_cards(u'Words')) == []
@@ -0,0 +1,89 @@
+import os
+import time
+
+from PIL import Image
+import pytest
+
+from resources.lib import pictures
+
+
+def _downloaded(tmpdir, name, size=(40, 20), mode='RGB'):
+    path = str(tmpdir.join(name))
+    Image.new(mode, size).save(path, 'PNG')
+    return path
+
+
+def test_large_picture_is_scaled_down_and_centred(tmpdir):
+    picture = pictures._prepare_picture(
+        _downloaded(tmpdir, 'a.png', size=(2800, 700)), str(tmpdir))
+    assert (picture.width, picture.height) == (1400, 350)
+    assert (picture.x, picture.y) == (260, 365)
+    assert Image.open(picture.path).size == (1400, 350)
+    assert picture.path.endswith('.jpg')
+
+
+def test_small_picture_keeps_its_size(tmpdir):
+    picture = pictures._prepare_picture(
+        _downloaded(tmpdir, 'a.png', size=(200, 100)), str(tmpdir))
+    assert (picture.x, picture.y, picture.width, picture.height) == \
+        (860, 490, 200, 100)
+
+
+def test_transparent_picture_stays_png(tmpdir):
+    picture = pictures._prepare_picture(
+        _downloaded(tmpdir, 'a.png', mode='RGBA'), str(tmpdir))
+    assert picture.path.endswith('.png')
+    assert Image.open(picture.path).mode == 'RGBA'
+
+
+def test_unreadable_picture(tmpdir):
+    path = tmpdir.join('a.png')
+    path.write('not a picture')
+    with pytest.raises(pictures.PictureError):
+        pictures._prepare_picture(str(path), str(tmpdir))
+
+
+def test_same_content_prepared_twice_keeps_the_display_file(tmpdir):
+    cache_dir = tmpdir.mkdir('img')
+    cache = pictures.PictureCache(str(cache_dir), 1024 * 1024)
+    # Both downloads prepare the content before either one is put
+    first = pictures._prepare_picture(
+        _downloaded(tmpdir, 'a.png'), str(cache_dir))
+    second = pictures._prepare_picture(
+        _downloaded(tmpdir, 'b.png'), str(cache_dir))
+    assert first.path != second.path
+
+    cache.put('http://a/1.png', 'digest', first)
+    cache.put('http://b/1.png', 'digest', second)
+
+    for url in ('http://a/1.png', 'http://b/1.png'):
+        picture = cache.get(url)
+        assert picture is not None
+        assert os.path.exists(picture.path)
+    assert sorted(os.listdir(str(cache_dir))) == ['cache.json', 'digest.jpg']
+
+
+def test_only_abandoned_download_files_are_removed(tmpdir):
+    cache_dir = tmpdir.mkdir('img')
+    abandoned = cache_dir.join(pictures._DOWNLOAD_PREFIX + 'old.jpg')
+    abandoned.write('')
+    abandoned.setmtime(time.time() - pictures._STALE_FILE - 60)
+    # Still written by the script or the service
+    cache_dir.join(pictures._DOWNLOAD_PREFIX + 'new.jpg').write('')
+    pictures.PictureCache(str(cache_dir), 1024 * 1024)
+    assert os.listdir(str(cache_dir)) == [pictures._DOWNLOAD_PREFIX + 'new.jpg']
+
+
+def test_display_files_unknown_to_the_index_are_removed(tmpdir):
+    cache_dir = tmpdir.mkdir('img')
+    cache = pictures.PictureCache(str(cache_dir), 1024 * 1024)
+    cache.put('http://a/1.png', 'kept', pictures._prepare_picture(
+        _downloaded(tmpdir, 'a.png'), str(cache_dir)))
+    # Its entry was lost when the other process saved its index
+    orphan = cache_dir.join('orphan.jpg')
+    orphan.write('')
+    orphan.setmtime(time.time() - pictures._STALE_FILE - 60)
+
+    cache = pictures.PictureCache(str(cache_dir), 1024 * 1024)
+    assert sorted(os.listdir(str(cache_dir))) == ['cache.json', 'kept.jpg']
+    assert cache.get('http://a/1.png') is not None
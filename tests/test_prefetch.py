@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from resources.lib import pictures
+from resources.lib import prefetch
+
+
+class Downloads(object):
+
+    def __init__(self, fail=None):
+        self.fail = fail or {}
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        with self.lock:
+            self.urls.append(url)
+        if url in self.fail:
+            raise self.fail[url]
+
+
+def _prefetcher(download, workers=1):
+    return prefetch.PicturePrefetcher(download, workers=workers)
+
+
+def test_picture_is_fetched_once():
+    download = Downloads()
+    prefetcher = _prefetcher(download, workers=3)
+    try:
+        prefetcher.request(['a', 'b'], 1)
+        prefetcher.request(['a'], 0)
+        prefetcher.wait('a', 5)
+        prefetcher.wait('b', 5)
+        prefetcher.wait('a', 5)
+    finally:
+        prefetcher.close()
+    assert sorted(download.urls) == ['a', 'b']
+
+
+def test_waited_picture_goes_first():
+    started = threading.Event()
+    release = threading.Event()
+    urls = []
+
+    def download(url):
+        urls.append(url)
+        if url == 'slow':
+            started.set()
+            release.wait(5)
+
+    prefetcher = _prefetcher(download)
+    try:
+        prefetcher.request(['slow'], 0)
+        started.wait(5)
+        prefetcher.request(['later', 'now'], 1)
+        # What wait asks for before it blocks
+        prefetcher.request(['now'], -1)
+        release.set()
+        prefetcher.wait('now', 5)
+        prefetcher.wait('later', 5)
+    finally:
+        prefetcher.close()
+    assert urls == ['slow', 'now', 'later']
+
+
+@pytest.mark.parametrize('error', [
+    pictures.PictureError('Forbidden'),
+    IOError('No space left on device'),
+    ValueError('Bad picture'),
+])
+def test_failed_download_raises_picture_error(error):
+    prefetcher = _prefetcher(Downloads(fail={'a': error}))
+    try:
+        with pytest.raises(pictures.PictureError) as excinfo:
+            prefetcher.wait('a', 5)
+    finally:
+        prefetcher.close()
+    assert str(error) in str(excinfo.value)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from resources.lib import quota
+
+
+def _in_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    return thread
+
+
+def test_background_waits_for_foreground_of_a_shared_priority():
+    priority = quota.Priority()
+    reads = quota.TokenBucket(20, 1, priority)
+    writes = quota.TokenBucket(20, 1, priority)
+    reads.acquire()
+    order = []
+    # The read waits about 50 ms for its next token, the write has one now
+    read = _in_thread(lambda: order.append(('read', reads.acquire())))
+    time.sleep(0.01)
+    write = _in_thread(
+        lambda: order.append(('write', writes.acquire(foreground=False))))
+    read.join()
+    write.join()
+    assert [name for name, _ in order] == ['read', 'write']
+
+
+def test_background_is_not_held_up_by_another_priority():
+    reads = quota.TokenBucket(20, 1)
+    writes = quota.TokenBucket(20, 1)
+    reads.acquire()
+    read = _in_thread(reads.acquire)
+    time.sleep(0.01)
+    assert writes.acquire(foreground=False) < 0.01
+    read.join()
+
+
+class Response(object):
+
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {}
+        if retry_after is not None:
+            self.headers['Retry-After'] = str(retry_after)
+
+
+class FlakyTransport(object):
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def test_reads_get_a_short_retry_budget():
+    transport = FlakyTransport(
+        [requests.ConnectionError()] * 10 + [Response(200)])
+    scheduler = quota.RequestScheduler(
+        transport, base_delay=0.001, max_foreground_delay=0.01)
+    with pytest.raises(requests.ConnectionError):
+        scheduler.get('http://sheets/')
+    assert transport.calls == 3
+    assert scheduler.stats['dropped'] == 1
+
+
+def test_reads_do_not_wait_out_a_long_retry_after():
+    transport = FlakyTransport([Response(429, retry_after=60), Response(200)])
+    scheduler = quota.RequestScheduler(transport, base_delay=0.001)
+    start = time.time()
+    assert scheduler.get('http://sheets/').status_code == 429
+    assert time.time() - start < 1
+    assert transport.calls == 1
+
+
+def test_writes_are_retried_longer():
+    transport = FlakyTransport([Response(503)] * 4 + [Response(200)])
+    scheduler = quota.RequestScheduler(transport, base_delay=0.001)
+    assert scheduler.put('http://sheets/').status_code == 200
+    assert scheduler.stats['retries'] == 4
+
+
+def test_background_reads_give_way_and_are_retried_longer():
+    transport = FlakyTransport([Response(503)] * 4 + [Response(200)])
+    scheduler = quota.RequestScheduler(transport, base_delay=0.001)
+    assert scheduler.get('http://sheets/', background=True).status_code == 200
+    assert scheduler.stats['retries'] == 4
@@ -0,0 +1,93 @@
+from resources.lib import scheduler
+from resources.lib.card import Card
+
+NOW = 1700000000.0
+DAY = 86400
+
+
+def _review(idx, days_overdue, interval=1):
+    return Card(idx, 'q', 'a', NOW - 10 * DAY,
+                NOW - days_overdue * DAY, 1, interval, 2.5)
+
+
+def _new(idx):
+    return Card(idx, 'q', 'a', None, 0, None, None, None)
+
+
+def _session(cards, **kwargs):
+    return scheduler.ReviewScheduler(cards, NOW, **kwargs)
+
+
+def test_relearning_card_waits_for_its_step():
+    lapsed = _review(2, 1)
+    session = _session([_review(3, 1)])
+    session.relearn(lapsed, NOW + 600)
+
+    assert session.next(NOW).idx == 3
+    # Not due yet and nothing else to show
+    assert session.next(NOW + 300) is None
+    assert len(session) == 1
+    assert session.next(NOW + 600).idx == 2
+    assert session.next(NOW + 600) is None
+
+
+def test_due_relearning_card_comes_first():
+    lapsed = _review(2, 1)
+    session = _session([_review(3, 1), _new(4)])
+    session.relearn(lapsed, NOW + 600)
+    assert session.next(NOW + 600).idx == 2
+
+
+def test_relearning_card_comes_early_only_when_asked():
+    lapsed = _review(2, 1)
+    session = _session([_review(3, 1)])
+    session.relearn(lapsed, NOW + 600)
+    assert session.next(NOW, early=True).idx == 3
+    assert session.next(NOW, early=True).idx == 2
+    assert session.next(NOW, early=True) is None
+
+
+def _drain(session, now=NOW):
+    cards = []
+    card = session.next(now)
+    while card is not None:
+        cards.append(card.idx)
+        card = session.next(now)
+    return cards
+
+
+def test_most_overdue_review_comes_first():
+    session = _session([
+        _review(2, 1), _review(3, 10), _review(4, 3, interval=1),
+        # Three days late on a 30 day interval is hardly late
+        _review(5, 3, interval=30)])
+    assert _drain(session) == [3, 4, 2, 5]
+
+
+def test_new_cards_in_sheet_order_between_reviews():
+    session = _session(
+        [_new(9), _new(7)] + [_review(idx, idx) for idx in range(2, 6)],
+        reviews_per_new=2)
+    assert _drain(session) == [5, 4, 7, 3, 2, 9]
+
+
+def test_only_new_cards_left():
+    session = _session([_new(3), _new(2), _review(4, 1)], reviews_per_new=4)
+    assert _drain(session) == [4, 2, 3]
+
+
+def test_session_limits():
+    session = _session(
+        [_new(idx) for idx in range(10, 15)] +
+        [_review(idx, idx) for idx in range(2, 7)],
+        max_reviews=2, max_new=1, reviews_per_new=1)
+    assert len(session) == 3
+    assert _drain(session) == [6, 10, 5]
+    assert len(session) == 0
+
+
+def test_cards_added_later_join_the_queues():
+    session = _session([_review(2, 1)], reviews_per_new=1)
+    assert session.next(NOW).idx == 2
+    session.add([_new(5), _review(3, 5)], NOW)
+    assert _drain(session) == [5, 3]
@@ -0,0 +1,112 @@
+import re
+
+from resources.lib import sheet
+
+_RANGE = re.compile(r'^.+!A(\d+):I(\d*)$')
+
+
+class Pages(object):
+    """Stands in for the values:batchGet of a worksheet of rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def __call__(self, a1_ranges):
+        values = []
+        for a1_range in a1_ranges:
+            self.ranges.append(a1_range)
+            first, last = _RANGE.match(a1_range).groups()
+            rows = self.rows[int(first) - 2:int(last) - 1 if last else None]
+            # The API leaves out the empty rows at the end of a range
+            while rows and not rows[-1]:
+                rows = rows[:-1]
+            values.append(rows)
+        return values
+
+
+def _sheets(rows):
+    sheets = sheet.GoogleSheets.__new__(sheet.GoogleSheets)
+    sheets._batch_get = Pages(rows)
+    return sheets
+
+
+def _rows(count):
+    return [
+        ['', '', '', '', '', 'Question {}'.format(i), 'Answer {}'.format(i)]
+        for i in range(count)]
+
+
+def test_short_page_is_followed_by_the_rest_of_the_grid():
+    sheets = _sheets(_rows(650))
+    pages = list(sheets.get_card_pages('Words', page_rows=100))
+    assert [(first, last) for first, last, _ in pages] == \
+        [(2, 101), (102, 301), (302, 701)]
+    assert sum(len(cards) for _, _, cards in pages) == 650
+    assert sheets._batch_get.ranges[-1] == 'Words!A702:I'
+
+
+def test_rows_after_a_gap_at_a_block_end_are_read():
+    rows = _rows(1000)
+    # Row 301 ends the second block, rows 292-301 are blank
+    rows[290:300] = [[]] * 10
+    sheets = _sheets(rows)
+    pages = list(sheets.get_card_pages('Words', page_rows=100))
+    assert pages[-1][0] == 302
+    assert sum(len(cards) for _, _, cards in pages) == 990
+    assert sheets._batch_get.ranges == [
+        'Words!A2:I101', 'Words!A102:I301', 'Words!A302:I']
+
+
+def test_runs_merge_small_gaps():
+    assert sheet._runs([2, 3, 5, 9, 30], max_gap=3) == [[2, 9], [30, 30]]
+    assert sheet._runs([2, 3, 5]) == [[2, 3], [5, 5]]
+
+
+class Ranges(object):
+    """Stands in for the values:batchGet of get_scheduled_cards."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __call__(self, a1_ranges, background=False):
+        self.calls.append((a1_ranges, background))
+        values = []
+        for a1_range in a1_ranges:
+            match = re.match(r'^.+!([A-Z])(\d+):([A-Z])(\d*)$', a1_range)
+            first, last = int(match.group(2)), match.group(4)
+            rows = self.rows[first - 2:int(last) - 1 if last else None]
+            columns = slice(0, 5) if match.group(1) == 'A' else slice(5, 9)
+            values.append([row[columns] for row in rows])
+        return values
+
+
+def _scheduled_rows(count):
+    return [
+        ['2020-01-01', '2020-01-02', '1', '1', '2.5',
+         'Question {}'.format(i), 'Answer {}'.format(i)]
+        for i in range(count)]
+
+
+def test_scattered_due_rows_take_few_ranges():
+    sheets = sheet.GoogleSheets.__new__(sheet.GoogleSheets)
+    sheets._batch_get = Ranges(_scheduled_rows(10000))
+    due = set(range(2, 10002, 97))
+    cards = sheets.get_scheduled_cards(
+        ['Words'], lambda sheet_name, idx, row: idx in due)['Words']
+    (schedule_ranges, background), (content_ranges, _) = \
+        sheets._batch_get.calls
+    assert background
+    assert content_ranges == ['Words!F2:I']
+    assert set(card.idx for card in cards if card.question) >= due
+
+
+def test_nearby_due_rows_share_a_range():
+    sheets = sheet.GoogleSheets.__new__(sheet.GoogleSheets)
+    sheets._batch_get = Ranges(_scheduled_rows(1000))
+    due = set([10, 20, 40, 500, 505])
+    sheets.get_scheduled_cards(
+        ['Words'], lambda sheet_name, idx, row: idx in due)
+    assert sheets._batch_get.calls[1][0] == \
+        ['Words!F10:I40', 'Words!F500:I505', 'Words!F1002:I']
@@ -0,0 +1,55 @@
+import time
+
+from resources.lib import sheetlist
+
+
+def _cache(tmpdir, sheet_id='sheet', ttl=600):
+    return sheetlist.SheetListCache(
+        str(tmpdir.join('sheet_names.json')), sheet_id, ttl=ttl)
+
+
+def test_nothing_cached_is_stale(tmpdir):
+    cache = _cache(tmpdir)
+    assert cache.get() is None
+    assert cache.stale
+
+
+def test_fetched_names_are_fresh_until_the_ttl(tmpdir, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(sheetlist.time, 'time', lambda: now)
+    cache = _cache(tmpdir)
+    cache.put(['a', 'b'])
+    assert not cache.stale
+
+    now += 601
+    cache = _cache(tmpdir)
+    assert cache.get() == ['a', 'b']
+    assert cache.stale
+
+
+def test_revalidation_tells_whether_the_names_changed(tmpdir, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(sheetlist.time, 'time', lambda: now)
+    assert _cache(tmpdir, ttl=0).put(['a', 'b'])
+
+    now += 1
+    cache = _cache(tmpdir, ttl=0)
+    assert cache.stale
+    assert not cache.put(['a', 'b'])
+    assert cache.put(['a', 'c'])
+    assert _cache(tmpdir).get() == ['a', 'c']
+    assert not _cache(tmpdir).stale
+
+
+def test_names_of_another_spreadsheet_are_not_used(tmpdir):
+    _cache(tmpdir).put(['a'])
+    cache = _cache(tmpdir, sheet_id='other')
+    assert cache.get() is None
+    assert cache.stale
+
+
+def test_unreadable_file_is_ignored(tmpdir):
+    tmpdir.join('sheet_names.json').write('{"sheet_id": ')
+    cache = _cache(tmpdir)
+    assert cache.get() is None
+    assert cache.put(['a'])
@@ -0,0 +1,101 @@
+import time
+
+from resources.lib import store
+from resources.lib.card import Card
+
+
+def _card(idx, next_practice=0, question='q'):
+    return Card(idx, question, 'a', None, next_practice, None, None, None)
+
+
+def _store(tmpdir, sheet_name='deck', cards=()):
+    card_store = store.CardStore(str(tmpdir.join('cards.db')))
+    card_store.merge(sheet_name, list(cards), time.time())
+    return card_store
+
+
+def test_reviewed_sheets_are_dirty_until_marked_clean(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2), _card(3)])
+    card_store.merge('other', [_card(2)], time.time())
+    assert card_store.get_dirty_sheets() == []
+
+    card = card_store.get_due_cards(['deck'], time.time())[0]
+    card.update(4)
+    card_store.save_card('deck', card)
+    assert card_store.get_dirty_sheets() == ['deck']
+
+    card_store.mark_clean([('deck', card)])
+    assert card_store.get_dirty_sheets() == []
+
+
+def _reviewed(card_store, idx, next_practice):
+    card = [
+        card for card in card_store.get_due_cards(['deck'], float('inf'))
+        if card.idx == idx][0]
+    card.first_practice = 1.0
+    card.next_practice = next_practice
+    card.streak = 1
+    card_store.save_card('deck', card)
+    return card
+
+
+def _state(card_store, idx):
+    card = [
+        card for card in card_store.get_due_cards(['deck'], float('inf'))
+        if card.idx == idx][0]
+    return card.next_practice, card.question
+
+
+def test_clean_row_takes_the_remote_state(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2, 100.0)])
+    to_push = card_store.merge('deck', [_card(2, 200.0)], time.time())
+    assert to_push == []
+    assert _state(card_store, 2) == (200.0, 'q')
+
+
+def test_dirty_row_is_pushed_if_the_sheet_did_not_change(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2, 100.0)])
+    _reviewed(card_store, 2, 500.0)
+    to_push = card_store.merge('deck', [_card(2, 100.0)], time.time())
+    assert [(card.idx, card.next_practice) for card in to_push] == [(2, 500.0)]
+    assert _state(card_store, 2) == (500.0, 'q')
+    # Dirty until the sheet has it
+    assert card_store.get_dirty_sheets() == ['deck']
+    card_store.mark_clean([('deck', to_push[0])])
+    assert card_store.get_dirty_sheets() == []
+    assert card_store.merge('deck', [to_push[0]], time.time()) == []
+
+
+def test_later_review_wins_when_both_changed(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2, 100.0), _card(3, 100.0)])
+    _reviewed(card_store, 2, 500.0)
+    _reviewed(card_store, 3, 300.0)
+    to_push = card_store.merge(
+        'deck', [_card(2, 400.0), _card(3, 400.0)], time.time())
+    assert [card.idx for card in to_push] == [2]
+    assert _state(card_store, 2)[0] == 500.0
+    assert _state(card_store, 3)[0] == 400.0
+    assert card_store.get_dirty_sheets() == ['deck']
+
+
+def test_sheet_wins_a_tie(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2, 100.0)])
+    _reviewed(card_store, 2, 400.0)
+    remote = _card(2, 400.0)
+    remote.streak = 7
+    assert card_store.merge('deck', [remote], time.time()) == []
+    card = card_store.get_due_cards(['deck'], float('inf'))[0]
+    assert card.streak == 7
+    assert card_store.get_dirty_sheets() == []
+
+
+def test_rows_without_content_keep_the_stored_one(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2, 100.0, question='stored')])
+    card_store.merge('deck', [_card(2, 200.0, question=None)], time.time())
+    assert _state(card_store, 2) == (200.0, 'stored')
+
+
+def test_rows_gone_from_the_sheet_are_removed(tmpdir):
+    card_store = _store(tmpdir, cards=[_card(2), _card(3), _card(4)])
+    card_store.merge('deck', [_card(2), _card(4)], time.time())
+    assert card_store.get_rows('deck') == set([2, 4])
@@ -0,0 +1,45 @@
+import time
+
+from resources.lib import store
+from resources.lib import sync
+from resources.lib.card import Card
+
+
+class Pages(object):
+    """Stands in for a backend of one worksheet in blocks of two rows."""
+
+    def __init__(self, count):
+        self.cards = [
+            Card(idx, 'q', 'a', None, 0, None, None, None)
+            for idx in range(2, 2 + count)]
+
+    def get_card_pages(self, sheet_name):
+        for i in range(0, len(self.cards), 2):
+            block = self.cards[i:i + 2]
+            yield block[0].idx, block[-1].idx, block
+
+    def get_scheduled_cards(self, sheet_names, needs_content):
+        return dict((sheet_name, self.cards) for sheet_name in sheet_names)
+
+    def update_cards(self, updates):
+        pass
+
+
+def test_stopped_stream_leaves_the_worksheet_unsynced(tmpdir):
+    card_store = store.CardStore(str(tmpdir.join('cards.db')))
+    blocks = []
+    sync.stream_sheets(
+        Pages(6), card_store, ['deck'], blocks.append,
+        stop=lambda: len(blocks) == 2)
+    assert card_store.get_rows('deck') == set([2, 3, 4, 5])
+    assert not card_store.has_sheet('deck')
+
+
+def test_stopped_sync_does_not_touch_the_store(tmpdir):
+    card_store = store.CardStore(str(tmpdir.join('cards.db')))
+    sync.stream_sheets(Pages(2), card_store, ['deck'], lambda cards: None)
+    synced_at = card_store.get_synced_at('deck')
+    time.sleep(0.01)
+    sync.sync_sheets(Pages(4), card_store, ['deck'], stop=lambda: True)
+    assert card_store.get_rows('deck') == set([2, 3])
+    assert card_store.get_synced_at('deck') == synced_at
@@ -0,0 +1,21 @@
+import requests
+
+from resources.lib import transport
+from stand_in_server import StandInServer, measure
+
+
+def test_pooled_transport_reuses_connections():
+    with StandInServer(connect_latency=0.05) as server:
+        unpooled = measure(requests.get, server.url + '/x', 10)
+        assert server.connections == 10
+        server.reset()
+
+        http = transport.Transport()
+        try:
+            pooled = measure(http.get, server.url + '/x', 10)
+        finally:
+            http.close()
+        assert server.requests == 10
+        assert server.connections == 1
+        assert http.stats['reused'] == 9
+    assert pooled < unpooled
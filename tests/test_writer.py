@@ -0,0 +1,141 @@
+import threading
+import time
+
+from resources.lib import backend
+from resources.lib import store
+from resources.lib import writer
+from resources.lib.card import Card
+
+
+class Sheets(object):
+    """Records the batches written, fails while ``error`` is set and for
+    good for the rows in ``rejected``."""
+
+    def __init__(self):
+        self.batches = []
+        self.error = None
+        self.rejected = set()
+        self.calls = 0
+        self.written = threading.Event()
+
+    def update_cards(self, updates):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if any(card.idx in self.rejected for _, card in updates):
+            raise backend.DeckError('Unable to parse range', permanent=True)
+        self.batches.append(
+            [(sheet_name, card.idx, card.streak) for sheet_name, card in updates])
+        self.written.set()
+
+
+def _card(idx, streak=1):
+    return Card(idx, 'q', 'a', 1.0, 2.0, streak, 1, 2.5)
+
+
+def test_updates_of_a_row_are_coalesced():
+    sheets = Sheets()
+    card_writer = writer.CardWriter(sheets, interval=60)
+    card = _card(2)
+    card_writer.put('deck', card)
+    card.streak = 2
+    card_writer.put('deck', card)
+    card_writer.put('deck', _card(3))
+    assert card_writer.pending == 2
+    card_writer.close()
+    assert sheets.batches == [[('deck', 2, 2), ('deck', 3, 1)]]
+    assert card_writer.pending == 0
+
+
+def test_full_batch_goes_out_without_waiting():
+    sheets = Sheets()
+    card_writer = writer.CardWriter(sheets, interval=60, batch_size=3)
+    for idx in range(2, 5):
+        card_writer.put('deck', _card(idx))
+    assert sheets.written.wait(5)
+    assert [len(batch) for batch in sheets.batches] == [3]
+    card_writer.close()
+
+
+def test_batch_goes_out_after_the_interval():
+    sheets = Sheets()
+    card_writer = writer.CardWriter(sheets, interval=0.1)
+    card_writer.put('deck', _card(2))
+    assert sheets.written.wait(5)
+    card_writer.close()
+    assert sheets.batches == [[('deck', 2, 1)]]
+
+
+def test_failed_batch_is_kept_for_the_next_one():
+    sheets = Sheets()
+    sheets.error = IOError('offline')
+    errors = []
+    card_writer = writer.CardWriter(
+        sheets, interval=0.05, on_error=errors.append)
+    card_writer.put('deck', _card(2))
+    while not errors:
+        time.sleep(0.01)
+    assert card_writer.pending == 1
+    sheets.error = None
+    assert sheets.written.wait(5)
+    card_writer.close()
+    assert sheets.batches == [[('deck', 2, 1)]]
+
+
+def test_written_reviews_are_marked_clean(tmpdir):
+    card_store = store.CardStore(str(tmpdir.join('cards.db')))
+    card_store.merge('deck', [Card(2, 'q', 'a', None, 0, None, None, None)],
+                     time.time())
+    card = card_store.get_due_cards(['deck'], time.time())[0]
+    card.update(4)
+    card_store.save_card('deck', card)
+    card_writer = writer.CardWriter(
+        Sheets(), interval=60, on_written=card_store.mark_clean)
+    card_writer.put('deck', card)
+    # Reviewed again before the write: the row stays dirty
+    card.update(5)
+    card_store.save_card('deck', card)
+    card_writer.close()
+    assert card_store.get_dirty_sheets() == ['deck']
+
+    card_writer = writer.CardWriter(
+        Sheets(), interval=60, on_written=card_store.mark_clean)
+    card_writer.put('deck', card)
+    card_writer.close()
+    assert card_store.get_dirty_sheets() == []
+
+
+def test_rejected_rows_are_dropped_the_others_written():
+    sheets = Sheets()
+    sheets.rejected = set([4])
+    errors = []
+    card_writer = writer.CardWriter(
+        sheets, interval=60, on_error=errors.append)
+    for idx in range(2, 8):
+        card_writer.put('deck', _card(idx))
+    card_writer.close()
+    written = sorted(idx for batch in sheets.batches for _, idx, _ in batch)
+    assert written == [2, 3, 5, 6, 7]
+    assert card_writer.pending == 0
+    assert len(errors) == 1
+
+
+def test_errors_are_reported_at_most_once_an_interval():
+    sheets = Sheets()
+    sheets.error = IOError('offline')
+    errors = []
+    card_writer = writer.CardWriter(
+        sheets, interval=0.01, on_error=errors.append, error_interval=60)
+    card_writer.put('deck', _card(2))
+    while sheets.calls < 5:
+        time.sleep(0.01)
+    assert len(errors) == 1
+    sheets.error = None
+    card_writer.close()
+    assert sheets.batches == [[('deck', 2, 1)]]
+
+
+def test_write_ending_after_the_store_closed(tmpdir):
+    card_store = store.CardStore(str(tmpdir.join('cards.db')))
+    card_store.close()
+    card_store.mark_clean([('deck', _card(2))])